@@ -0,0 +1,204 @@
+import argparse
+import json
+import multiprocessing
+import multiprocessing.connection
+import random
+import sys
+import time
+import traceback
+
+import build_map
+import cluster_solver as cs
+import genetic_algorithm_solver as gf
+import genetic_functions_keep_sorted as gf_keep_sorted
+import island_genetic_solver as igs
+import taxi_problem_solver as tps
+import utils
+from distance_matrix import DistanceMatrix
+from genetic_funcs_interface import GeneticFuncsInterface
+
+DEFAULT_TIMEOUT = 60  # seconds
+DEFAULT_SEED = 5
+PENDING_PER_PROCESS = 4  # in ordered mode, the number of finished results waiting for earlier ones is bounded by this
+
+
+def _from_greedy(solver_class, **kwargs):
+    """an algorithm that runs the solver from the greedy solution"""
+    def solve(passengers, taxi_start_position, distances):
+        sol_greedy = tps.GreedyTaxiProblemSolver(passengers, taxi_start_position, distances).solve()
+        return solver_class(passengers, taxi_start_position, sol_greedy, distances=distances, **kwargs).solve()
+    return solve
+
+
+def _brute_force(passengers, taxi_start_position, distances):
+    sol_greedy = tps.GreedyTaxiProblemSolver(passengers, taxi_start_position, distances).solve()
+    alg = tps.BruteForcePruningSolver(passengers, taxi_start_position,
+                                      utils.get_solution_len(sol_greedy, distances) + utils.EPSILON, sol_greedy,
+                                      distances)
+    alg.solve([(taxi_start_position, 0)])
+    return alg.best_solution
+
+
+# name: function that gets the passengers, the taxi start position and the distance matrix and returns a solution
+ALGORITHMS = {
+    'Greedy': lambda passengers, start, distances: tps.GreedyTaxiProblemSolver(passengers, start, distances).solve(),
+    'LocalSearch': lambda passengers, start, distances: _from_greedy(tps.LocalSearchTaxiProblemSolver)(
+        passengers, start, distances)[0],
+    'HillClimbing': _from_greedy(tps.HillClimbingTaxiProblemSolver),
+    'SimulatedAnnealing': _from_greedy(tps.SimulatedAnnealingTaxiProblemSolver),
+    'BeamLocalSearch': _from_greedy(tps.BeamLocalSearchTaxiProblemSolver),
+    'Multiple': _from_greedy(tps.MultipleLocalSearchTaxiProblemSolver, n_tries=35),
+    'TabuSearch': _from_greedy(tps.TabuSearchTaxiProblemSolver),
+    'Genetic': lambda passengers, start, distances: gf.GeneticTaxiProblemSolver(
+        passengers, start, GeneticFuncsInterface(gf_keep_sorted.crossover_keep_sorted,
+                                                 gf_keep_sorted.mutation_keep_sorted), distances).solve()[0],
+    'VectorizedGenetic': lambda passengers, start, distances: gf.VectorizedGeneticTaxiProblemSolver(
+        passengers, start, distances=distances).solve()[0],
+    'IslandGenetic': lambda passengers, start, distances: igs.IslandGeneticTaxiProblemSolver(
+        passengers, start, GeneticFuncsInterface(gf_keep_sorted.crossover_keep_sorted,
+                                                 gf_keep_sorted.mutation_keep_sorted), processes=1,
+        distances=distances).solve()[0],
+    'Cluster': lambda passengers, start, distances: cs.ClusterTaxiProblemSolver(passengers, start, processes=1,
+                                                                                distances=distances).solve(),
+    'BruteForce': _brute_force,
+    'DynamicProgramming': lambda passengers, start, distances: tps.DynamicProgrammingSolver(passengers, start,
+                                                                                            distances).solve(),
+}
+
+
+def parse_instance(line):
+    """
+    :param line: a JSON object with "taxi_start": [x, y] and "passengers": a list of {"start": [x, y], "end": [x, y]}
+    (optionally with "passenger_id", else the passengers get ids 1..n). "id" and "seed" are optional.
+    :return: the instance as a dictionary, the list of passengers and the taxi start position
+    """
+    instance = json.loads(line)
+    passengers = [build_map.Passenger(p.get('passenger_id', i), tuple(p['start']), tuple(p['end']))
+                  for i, p in enumerate(instance['passengers'], 1)]
+    return instance, passengers, tuple(instance['taxi_start'])
+
+
+def solve_instance(line, algorithm, default_seed):
+    """
+    solves a single instance
+    :return: a result dictionary with "status" ok and the solution and its length
+    """
+    instance, passengers, taxi_start_position = parse_instance(line)
+    random.seed(instance.get('seed', default_seed))
+    distances = DistanceMatrix(passengers, taxi_start_position)
+    start_time = time.perf_counter()
+    solution = ALGORITHMS[algorithm](passengers, taxi_start_position, distances)
+    utils.check_solution(solution)
+    return {'status': 'ok', 'time': time.perf_counter() - start_time,
+            'length': utils.get_solution_len(solution, distances), 'solution': solution}
+
+
+def _instance_worker(conn, line, algorithm, default_seed):
+    """the target of a worker process: sends the result of a single instance (or its error) through conn"""
+    try:
+        result = solve_instance(line, algorithm, default_seed)
+    except Exception as e:
+        result = {'status': 'error', 'error': repr(e), 'traceback': traceback.format_exc()}
+    conn.send(result)
+    conn.close()
+
+
+def _instance_id(line, index):
+    """the "id" of the instance, or its line number if it has none or can not be parsed"""
+    try:
+        return json.loads(line).get('id', index)
+    except (ValueError, AttributeError):
+        return index
+
+
+def solve_batch(lines, algorithm, processes=None, timeout=DEFAULT_TIMEOUT, ordered=False, default_seed=DEFAULT_SEED):
+    """
+    solves every instance in a separate worker process, at most 'processes' at a time. A worker that runs longer than
+    'timeout' seconds is killed and an instance that fails gets an error result, without stopping the batch.
+    Lines are read only when a worker is free, so the memory does not grow with the size of the batch.
+    :param lines: iterable of JSON lines, one instance per line (empty lines are skipped)
+    :param ordered: yield the results by the order of the input instead of the order they finish
+    :return: generator of result dictionaries, each with the "id" of its instance
+    """
+    processes = processes or multiprocessing.cpu_count()
+    max_pending = processes * PENDING_PER_PROCESS
+    running = {}  # connection: (index, id, process, deadline)
+    finished = {}  # index: result, waiting for earlier results in ordered mode
+    next_to_yield = 0
+    lines = (line for line in lines if line.strip())
+    index = 0
+    exhausted = False
+    while True:
+        while not exhausted and len(running) < processes and len(finished) < max_pending:
+            line = next(lines, None)
+            if line is None:
+                exhausted = True
+                break
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=_instance_worker, args=(sender, line, algorithm, default_seed))
+            process.start()
+            sender.close()
+            running[receiver] = (index, _instance_id(line, index), process, time.monotonic() + timeout)
+            index += 1
+        if not running:
+            return  # every earlier result was yielded, so the input is exhausted
+        wait_time = max(0, min(deadline for _, _, _, deadline in running.values()) - time.monotonic())
+        for receiver in multiprocessing.connection.wait(list(running), wait_time):
+            instance_index, instance_id, process, _ = running.pop(receiver)
+            try:
+                result = receiver.recv()
+            except EOFError:
+                result = None
+            receiver.close()
+            process.join()
+            if result is None:
+                result = {'status': 'error', 'error': 'worker exited with code ' + str(process.exitcode)}
+            finished[instance_index] = dict(result, id=instance_id)
+        now = time.monotonic()
+        for receiver in [r for r, (_, _, _, deadline) in running.items() if deadline <= now]:
+            instance_index, instance_id, process, _ = running.pop(receiver)
+            process.kill()
+            process.join()
+            receiver.close()
+            finished[instance_index] = {'status': 'timeout', 'id': instance_id}
+
+        if ordered:
+            while next_to_yield in finished:
+                yield finished.pop(next_to_yield)
+                next_to_yield += 1
+        else:
+            for instance_index in list(finished):
+                yield finished.pop(instance_index)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Taxi Driver Problem Batch Solver')
+    parser.add_argument('-i', '--input', help='JSONL file of instances, stdin by default.', type=str)
+    parser.add_argument('-o', '--output', help='JSONL file for the results, stdout by default.', type=str)
+    parser.add_argument('-a', '--algorithm', choices=list(ALGORITHMS), help='choose which algorithm to run.',
+                        default='Greedy', type=str)
+    parser.add_argument('-p', '--processes', help='Number of worker processes, all the cpus by default.',
+                        default=None, type=int)
+    parser.add_argument('-t', '--timeout', help='Seconds before an instance is stopped.', default=DEFAULT_TIMEOUT,
+                        type=float)
+    parser.add_argument('-s', '--random_seed', help='Seed of instances that have no "seed".', default=DEFAULT_SEED,
+                        type=int)
+    parser.add_argument('--ordered', help='Write the results by the order of the input.', action='store_true')
+
+    args = parser.parse_args()
+    input_file = open(args.input) if args.input else sys.stdin
+    output_file = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        for result in solve_batch(input_file, args.algorithm, args.processes, args.timeout, args.ordered,
+                                  args.random_seed):
+            output_file.write(json.dumps(result) + '\n')
+            output_file.flush()
+    finally:
+        if args.input:
+            input_file.close()
+        if args.output:
+            output_file.close()
+
+
+if __name__ == "__main__":
+    main()
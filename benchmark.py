@@ -0,0 +1,202 @@
+import argparse
+import csv
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+import build_map
+import genetic_algorithm_solver as gf
+import genetic_functions_keep_sorted as gf_keep_sorted
+import island_genetic_solver as igs
+import taxi_problem_solver as tps
+import utils
+from distance_matrix import DistanceMatrix
+from genetic_funcs_interface import GeneticFuncsInterface
+
+DEFAULT_NUM_OF_PASSENGERS = [5, 10, 20]
+DEFAULT_SEEDS = [1, 2, 3]
+MAX_PASSENGERS_FOR_OPTIMUM = 10
+TIME_TOLERANCE = 0.25  # a run is a time regression if it is slower than the baseline by more than this fraction
+MIN_TIME_TO_COMPARE = 0.01  # seconds, faster runs are too noisy to compare
+QUALITY_TOLERANCE = 0.001  # a run is a quality regression if it is longer than the baseline by more than this fraction
+
+
+def _keep_sorted_funcs():
+    return GeneticFuncsInterface(gf_keep_sorted.crossover_keep_sorted, gf_keep_sorted.mutation_keep_sorted)
+
+
+def _solve_brute_force_pruning(passengers, distances):
+    sol_greedy = tps.GreedyTaxiProblemSolver(passengers, (0, 0), distances).solve()
+    alg = tps.BruteForcePruningSolver(passengers, (0, 0), utils.get_solution_len(sol_greedy, distances) + utils.EPSILON,
+                                      sol_greedy, distances)
+    alg.solve([((0, 0), 0)])
+    return alg.best_solution
+
+
+def _from_greedy(solver_class, **kwargs):
+    """a benchmark function that runs the solver from the greedy solution"""
+    def solve(passengers, distances):
+        sol_greedy = tps.GreedyTaxiProblemSolver(passengers, (0, 0), distances).solve()
+        solution = solver_class(passengers, (0, 0), sol_greedy, distances=distances, **kwargs).solve()
+        return solution[0] if solver_class is tps.LocalSearchTaxiProblemSolver else solution
+    return solve
+
+
+# name: (function that gets the passengers and the distance matrix and returns a solution, max number of passengers)
+SOLVERS = {
+    'Greedy': (lambda passengers, distances: tps.GreedyTaxiProblemSolver(passengers, (0, 0), distances).solve(),
+               None),
+    'Random': (lambda passengers, distances: tps.RandomTaxiProblemSolver(passengers, (0, 0),
+                                                                         distances=distances).solve(), None),
+    'LocalSearch': (_from_greedy(tps.LocalSearchTaxiProblemSolver), None),
+    'HillClimbing': (_from_greedy(tps.HillClimbingTaxiProblemSolver), None),
+    'SimulatedAnnealing': (_from_greedy(tps.SimulatedAnnealingTaxiProblemSolver), None),
+    'BeamLocalSearch': (_from_greedy(tps.BeamLocalSearchTaxiProblemSolver), 30),
+    'Multiple': (_from_greedy(tps.MultipleLocalSearchTaxiProblemSolver, n_tries=35), None),
+    'TabuSearch': (_from_greedy(tps.TabuSearchTaxiProblemSolver), None),
+    'Genetic': (lambda passengers, distances: gf.GeneticTaxiProblemSolver(passengers, (0, 0), _keep_sorted_funcs(),
+                                                                          distances).solve()[0], None),
+    'VectorizedGenetic': (lambda passengers, distances: gf.VectorizedGeneticTaxiProblemSolver(
+        passengers, (0, 0), distances=distances).solve()[0], None),
+    'IslandGenetic': (lambda passengers, distances: igs.IslandGeneticTaxiProblemSolver(
+        passengers, (0, 0), _keep_sorted_funcs(), num_of_islands=4, processes=1, distances=distances).solve()[0],
+                      None),
+    'BruteForce': (lambda passengers, distances: tps.BruteForceSolver(passengers, (0, 0), distances).solve(), 4),
+    'BruteForcePruning': (_solve_brute_force_pruning, 7),
+    'DynamicProgramming': (lambda passengers, distances: tps.DynamicProgrammingSolver(passengers, (0, 0),
+                                                                                      distances).solve(),
+                           MAX_PASSENGERS_FOR_OPTIMUM),
+}
+
+
+def run_solver(name, passengers, seed, measure_memory):
+    """
+    runs the solver once on a new distance matrix, with the random module seeded by 'seed'
+    :return: the solution, the run time, the peak memory in bytes (None if not measured) and the number of evaluations
+    """
+    distances = DistanceMatrix(passengers, (0, 0))
+    distances.matrix  # computed outside of the measurement
+    solve, _ = SOLVERS[name]
+    random.seed(seed)
+    if measure_memory:
+        tracemalloc.start()
+    start_time = time.perf_counter()
+    solution = solve(passengers, distances)
+    run_time = time.perf_counter() - start_time
+    peak_memory = None
+    if measure_memory:
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return solution, run_time, peak_memory, distances.num_of_evaluations
+
+
+def run_benchmark(solver_names, passenger_counts, seeds, measure_memory=True):
+    """
+    runs every solver on every instance. The instance of (n, seed) is build_map_of_passengers(n) after
+    random.seed(seed). The peak memory is measured in a second run, because tracing the memory slows the run down.
+    :return: a list of records, one for every solver, number of passengers and seed
+    """
+    records = []
+    for num_of_passengers in passenger_counts:
+        for seed in seeds:
+            random.seed(seed)
+            passengers = build_map.build_map_of_passengers(num_of_passengers)
+            optimum = None
+            if num_of_passengers <= MAX_PASSENGERS_FOR_OPTIMUM:
+                optimum = utils.get_solution_len(tps.DynamicProgrammingSolver(passengers, (0, 0)).solve())
+
+            for name in solver_names:
+                max_passengers = SOLVERS[name][1]
+                if max_passengers is not None and num_of_passengers > max_passengers:
+                    continue
+                solution, run_time, _, evaluations = run_solver(name, passengers, seed, False)
+                utils.check_solution(solution)
+                length = utils.get_solution_len(solution)
+                peak_memory = run_solver(name, passengers, seed, True)[2] if measure_memory else None
+                records.append({'solver': name, 'num_of_passengers': num_of_passengers, 'seed': seed,
+                                'time': run_time, 'peak_memory': peak_memory, 'evaluations': evaluations,
+                                'length': length, 'gap': None if not optimum else length / optimum - 1})
+                print(name, num_of_passengers, seed, round(run_time, 4), round(length, 2), file=sys.stderr)
+    return records
+
+
+def save_records(records, path):
+    """saves the records as csv if the path ends with .csv, else as json"""
+    with open(path, 'w', newline='') as f:
+        if path.endswith('.csv'):
+            writer = csv.DictWriter(f, fieldnames=list(records[0].keys()) if records else [])
+            writer.writeheader()
+            writer.writerows(records)
+        else:
+            json.dump(records, f, indent=2)
+
+
+def load_records(path):
+    """loads records saved by save_records"""
+    with open(path, newline='') as f:
+        if not path.endswith('.csv'):
+            return json.load(f)
+        records = list(csv.DictReader(f))
+    for record in records:
+        for key in ('num_of_passengers', 'seed', 'evaluations'):
+            record[key] = int(record[key])
+        for key in ('time', 'length'):
+            record[key] = float(record[key])
+    return records
+
+
+def compare_records(records, baseline, time_tolerance=TIME_TOLERANCE, quality_tolerance=QUALITY_TOLERANCE):
+    """
+    compares every record to the baseline record of the same solver, number of passengers and seed
+    :return: a list of messages about time and quality regressions
+    """
+    baseline_by_key = {(r['solver'], r['num_of_passengers'], r['seed']): r for r in baseline}
+    regressions = []
+    for record in records:
+        key = (record['solver'], record['num_of_passengers'], record['seed'])
+        if key not in baseline_by_key:
+            continue
+        base = baseline_by_key[key]
+        if base['time'] >= MIN_TIME_TO_COMPARE and record['time'] > base['time'] * (1 + time_tolerance):
+            regressions.append('time regression ' + str(key) + ': ' + str(round(base['time'], 4)) + 's -> ' +
+                               str(round(record['time'], 4)) + 's')
+        if record['length'] > base['length'] * (1 + quality_tolerance):
+            regressions.append('quality regression ' + str(key) + ': ' + str(round(base['length'], 2)) + ' -> ' +
+                               str(round(record['length'], 2)))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Taxi Driver Problem Benchmark')
+    parser.add_argument('-n', '--num_of_passengers', help='Numbers of passengers of the instances.', nargs='+',
+                        default=DEFAULT_NUM_OF_PASSENGERS, type=int)
+    parser.add_argument('-s', '--seeds', help='Seeds of the instances.', nargs='+', default=DEFAULT_SEEDS, type=int)
+    parser.add_argument('-a', '--algorithms', choices=list(SOLVERS), help='Solvers to run, all of them by default.',
+                        nargs='+', default=list(SOLVERS))
+    parser.add_argument('-o', '--output', help='File to save the results to (.json or .csv).', type=str)
+    parser.add_argument('-c', '--compare', help='Baseline results file to compare to.', type=str)
+    parser.add_argument('--time_tolerance', help='Allowed slow down before a time regression is reported.',
+                        default=TIME_TOLERANCE, type=float)
+    parser.add_argument('--no_memory', help='Do not measure the peak memory.', action='store_true')
+
+    args = parser.parse_args()
+    records = run_benchmark(args.algorithms, args.num_of_passengers, args.seeds, not args.no_memory)
+    if args.output:
+        save_records(records, args.output)
+    else:
+        json.dump(records, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        regressions = compare_records(records, load_records(args.compare), args.time_tolerance)
+        for regression in regressions:
+            print(regression)
+        if regressions:
+            sys.exit(1)
+        print('no regressions')
+
+
+if __name__ == "__main__":
+    main()
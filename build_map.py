@@ -1,11 +1,19 @@
 import random
 
+import numpy as np
+
+MAP_SIZE = 1000  # the stations are in [0, MAP_SIZE] x [0, MAP_SIZE]
+NUM_OF_HOTSPOTS = 10
+HOTSPOT_STD = 40  # the standard deviation of the distance of a station from its hotspot, on every axis
+
 
 class Passenger:
     """
     Class that represents a passenger in the Taxi Driver Problem. Each passenger has a unique id, a pick up point
     (start) and a drop point (end)
     """
+    __slots__ = ('passenger_id', 'start', 'end')
+
     def __init__(self, passenger_id, start, end):
         self.passenger_id = passenger_id
         self.start = start
@@ -15,6 +23,67 @@ class Passenger:
         return 'passenger id ' + str(self.passenger_id) + ': start: ' + str(self.start) + ', end: ' + str(self.end)
 
 
+class PassengerTable:
+    """
+    The passengers of a (huge) instance by columns: a numpy array of the ids, of the x and of the y of the pick ups and
+    of the x and of the y of the drops, so a passenger takes 5 numbers (20 bytes with the int32 columns of
+    generate_passenger_table) instead of an object with its tuples.
+    It can be used as a list of passengers: indexing and iterating it gives Passenger views, built on demand with
+    python numbers, and slicing it gives a table of the sliced rows.
+    """
+
+    def __init__(self, passenger_ids, start_x, start_y, end_x, end_y):
+        """
+
+        :param passenger_ids: array of the unique ids of the passengers
+        :param start_x: array of the x of the pick up points, start_y, end_x and end_y the same for the other columns
+        """
+        self.passenger_ids = np.asarray(passenger_ids)
+        self.start_x, self.start_y = np.asarray(start_x), np.asarray(start_y)
+        self.end_x, self.end_y = np.asarray(end_x), np.asarray(end_y)
+
+    @classmethod
+    def from_passengers(cls, list_of_passengers):
+        """builds a table from a list of Passenger"""
+        return cls([p.passenger_id for p in list_of_passengers],
+                   [p.start[0] for p in list_of_passengers], [p.start[1] for p in list_of_passengers],
+                   [p.end[0] for p in list_of_passengers], [p.end[1] for p in list_of_passengers])
+
+    def __len__(self):
+        return len(self.passenger_ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return PassengerTable(self.passenger_ids[index], self.start_x[index], self.start_y[index],
+                                  self.end_x[index], self.end_y[index])
+        return Passenger(self.passenger_ids[index].item(), (self.start_x[index].item(), self.start_y[index].item()),
+                         (self.end_x[index].item(), self.end_y[index].item()))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def to_passengers(self):
+        """the passengers as a list of Passenger"""
+        return list(self)
+
+    @property
+    def nbytes(self):
+        """the memory of the columns"""
+        return sum(column.nbytes for column in (self.passenger_ids, self.start_x, self.start_y, self.end_x, self.end_y))
+
+    def station_coordinates(self, taxi_start_position):
+        """
+        :return: array of shape (2n + 1, 2) of the (x, y) of the stations by station id (see DistanceMatrix): the taxi
+        start position, then the pick up and the drop of every passenger
+        """
+        coordinates = np.empty((2 * len(self) + 1, 2), dtype=float)
+        coordinates[0] = taxi_start_position
+        coordinates[1::2, 0], coordinates[1::2, 1] = self.start_x, self.start_y
+        coordinates[2::2, 0], coordinates[2::2, 1] = self.end_x, self.end_y
+        return coordinates
+
+
 def build_map_of_passengers(num_of_passengers):
     """
     build a list of 'num_of_passengers' randomly initialized passengers (random pick up and drop stations)
@@ -23,8 +92,34 @@ def build_map_of_passengers(num_of_passengers):
     """
     list_of_passengers = []
     for i in range(1, num_of_passengers + 1):
-        start = (random.randint(0, 1000), random.randint(0, 1000))
-        end = (random.randint(0, 1000), random.randint(0, 1000))
+        start = (random.randint(0, MAP_SIZE), random.randint(0, MAP_SIZE))
+        end = (random.randint(0, MAP_SIZE), random.randint(0, MAP_SIZE))
         list_of_passengers.append(Passenger(i, start, end))
 
     return list_of_passengers
+
+
+def generate_passenger_table(num_of_passengers, distribution='uniform', seed=None, num_of_hotspots=NUM_OF_HOTSPOTS,
+                             hotspot_std=HOTSPOT_STD):
+    """
+    builds a table of 'num_of_passengers' random passengers with ids 1..n, drawn by array operations, so a million
+    passengers take a fraction of a second
+    :param distribution: 'uniform' for points uniformly spread on the map, or 'hotspot' for points around
+    num_of_hotspots random centers, every point around a center drawn independently
+    :param seed: seed of the numpy random generator, the same seed gives the same table
+    :param hotspot_std: the standard deviation of the distance of a point from its center, on every axis
+    :return: a PassengerTable with int32 columns
+    """
+    rng = np.random.default_rng(seed)
+    if distribution == 'uniform':
+        points = rng.integers(0, MAP_SIZE + 1, size=(4, num_of_passengers), dtype=np.int32)
+    elif distribution == 'hotspot':
+        centers = rng.integers(0, MAP_SIZE + 1, size=(num_of_hotspots, 2))
+        # the pick up and the drop of a passenger are around two independent centers
+        chosen = rng.integers(0, num_of_hotspots, size=(2, num_of_passengers))
+        offsets = rng.normal(0, hotspot_std, size=(2, 2, num_of_passengers))
+        points = np.clip(np.rint(centers.T[:, chosen] + offsets), 0, MAP_SIZE).astype(np.int32)
+        points = points.transpose(1, 0, 2).reshape(4, num_of_passengers)  # start x, start y, end x, end y
+    else:
+        raise ValueError('unknown distribution ' + str(distribution))
+    return PassengerTable(np.arange(1, num_of_passengers + 1, dtype=np.int32), *points)
@@ -0,0 +1,315 @@
+import math
+import multiprocessing
+import random
+
+import numpy as np
+
+import build_map
+import taxi_problem_solver as tps
+import utils
+from distance_matrix import DistanceMatrix, START_STATION
+from route import Route
+from solver_observer import observed, observe_phase
+
+KMEANS_ITERATIONS = 20
+NEAR_CLUSTER_FACTOR = 1.5  # a drop is close to a cluster if it is inside this many times the radius of the cluster
+SEAM_WINDOW = 10  # number of stations on every side of a seam that the repair may move
+
+_cluster_solve = None  # the function that solves a cluster in a worker process
+_cluster_provider = None  # the DistanceProvider of the clusters in a worker process
+
+
+def solve_with_hill_climbing(list_of_passengers, taxi_start_position, distances):
+    """the default way to solve a cluster: hill climbing from the greedy solution"""
+    sol_greedy = tps.GreedyTaxiProblemSolver(list_of_passengers, taxi_start_position, distances).solve()
+    return tps.HillClimbingTaxiProblemSolver(list_of_passengers, taxi_start_position, sol_greedy, distances).solve()
+
+
+def _init_cluster_worker(solve_cluster, provider):
+    """keeps the solve function and the distance provider in the worker process, so only the clusters are sent to it"""
+    global _cluster_solve, _cluster_provider
+    _cluster_solve, _cluster_provider = solve_cluster, provider
+
+
+def _solve_cluster(task):
+    """
+    solves one cluster
+    :param task: (list of passengers of the cluster, start position of the taxi, seed)
+    :return: the station ids of the solution, in the station ids of the cluster
+    """
+    list_of_passengers, taxi_start_position, seed = task
+    distances = DistanceMatrix(list_of_passengers, taxi_start_position, _cluster_provider)
+    with utils.seeded_random(seed):
+        return distances.solution_to_ids(_cluster_solve(list_of_passengers, taxi_start_position, distances))
+
+
+def kmeans(points, k, rng, num_iterations=KMEANS_ITERATIONS):
+    """
+    Lloyd's k-means from k random points
+    :param points: array of shape (n, 2)
+    :param rng: numpy Generator that draws the first centers
+    :return: the cluster of every point (an array of n labels in range(k))
+    """
+    centers = points[rng.choice(len(points), k, replace=False)]
+    labels = None
+    for _ in range(num_iterations):
+        new_labels = ((points[:, np.newaxis, :] - centers[np.newaxis, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+        if labels is not None and np.array_equal(labels, new_labels):
+            break
+        labels = new_labels
+        counts = np.bincount(labels, minlength=k)
+        for axis in range(2):
+            sums = np.bincount(labels, weights=points[:, axis], minlength=k)
+            centers[:, axis] = np.where(counts > 0, sums / np.maximum(counts, 1), centers[:, axis])
+    return labels
+
+
+def grid_clusters(points, k):
+    """
+    :param points: array of shape (n, 2)
+    :return: the cell of every point on a grid of about k cells over the bounding box of the points
+    """
+    num_of_cols = math.ceil(math.sqrt(k))
+    num_of_rows = math.ceil(k / num_of_cols)
+    low, high = points.min(axis=0), points.max(axis=0)
+    size = np.maximum(high - low, 1) / (num_of_cols, num_of_rows)
+    cells = np.minimum(((points - low) // size).astype(int), (num_of_cols - 1, num_of_rows - 1))
+    return cells[:, 1] * num_of_cols + cells[:, 0]
+
+
+class _WindowDistances:
+    """
+    the distance lookups that get_move_delta needs for the moves inside a window of the route, from a matrix of only
+    the stations around the window instead of the full matrix of the instance
+    """
+
+    def __init__(self, station_ids, coordinates, provider):
+        """
+
+        :param station_ids: the stations of the window and the station before and after it
+        :param coordinates: the coordinates of all the stations of the instance, indexed by station id
+        :param provider: the DistanceProvider of the instance
+        """
+        self._rows = {station_id: i for i, station_id in enumerate(station_ids)}
+        points = coordinates[station_ids]
+        self._matrix = provider.pairwise(points, points).tolist()
+        self.num_of_evaluations = 0
+
+    def distance(self, a, b):
+        return self._matrix[self._rows[a]][self._rows[b]]
+
+
+class ClusterTaxiProblemSolver:
+    """
+    Solves large instances by decomposition: the stations are split into spatial clusters (k-means or a grid), every
+    cluster is solved on its own by any solver in parallel worker processes, the sub routes are stitched by the order
+    of the clusters, and a local search repairs the route around the seams between the clusters.
+    A passenger whose pick up and drop are in different clusters is picked up in the sub route of its pick up cluster
+    and dropped in the sub route of its drop cluster. If the drop cluster comes first in the order of the clusters,
+    the drop is made on a return pass that visits the clusters again in reverse order after the last one, so the
+    stitched route is always legal.
+    The decomposition bounds the memory and the time of every sub solver, not the length: the detours of the seams
+    and of the return pass cost about as much as the sub solvers save, so the stitched route is about as long as the
+    greedy route (on 600 passengers it was 4% longer on uniform demand and 0.4% shorter on hotspots), and a hill
+    climbing from the greedy solution with k nearest candidates is about 12% shorter on hotspots when the full matrix
+    fits in memory. With the Euclidean distance the greedy route is also built (it needs no matrix) and the shorter of
+    the two is returned. The clusters are always spatial (by the coordinates), while the clusters are solved and the
+    seams are repaired with the distance provider of the instance.
+    """
+    observer = None  # a SolverObserver that collects counters while solving
+    budget = None  # a SolverBudget that limits the repair, the clusters are solved by the solve_cluster function
+
+    def __init__(self, list_of_passengers, taxi_start_position, cluster_size=25, method='kmeans',
+                 solve_cluster=solve_with_hill_climbing, processes=None, distances=None, seed=None):
+        """
+
+        :param list_of_passengers: list of passengers to try find a good rout between
+        :param taxi_start_position: the start position (coordinate) of the taxi driver
+        :param cluster_size: the average number of passengers in a cluster
+        :param method: 'kmeans' or 'grid'
+        :param solve_cluster: function (list of passengers, taxi start position, DistanceMatrix) -> solution that
+        solves every cluster. It is sent to the worker processes, so it should be a module level function
+        :param processes: number of worker processes, the number of cpus if None. 1 solves the clusters in this process
+        :param distances: DistanceMatrix of the instance, built from the passengers if not given. Only its coordinates
+        and its distance provider are used, so the full matrix is never computed
+        :param seed: seed of the k-means centers and of the cluster solvers, drawn from the random module if None
+        """
+        if method not in ('kmeans', 'grid'):
+            raise ValueError('unknown clustering method ' + str(method))
+        self.list_of_passengers = list_of_passengers
+        self.taxi_start_position = taxi_start_position
+        self.cluster_size = cluster_size
+        self.method = method
+        self.solve_cluster = solve_cluster
+        self.processes = processes
+        self.distances = distances if distances is not None else DistanceMatrix(list_of_passengers,
+                                                                                taxi_start_position)
+        self.seed = seed
+
+    def __str__(self):
+        return 'Cluster And Stitch'
+
+    def cluster_stations(self, rng):
+        """
+        :return: the cluster of every station (an array indexed by station id, START_STATION gets -1), the list of
+        clusters in the order they are visited and the center of every cluster
+        """
+        points = self.distances.coordinates[1:]
+        k = max(1, min(len(self.list_of_passengers) // self.cluster_size, len(points)))
+        labels = kmeans(points, k, rng) if self.method == 'kmeans' else grid_clusters(points, k)
+        clusters = np.unique(labels)
+        centers = {c: points[labels == c].mean(axis=0) for c in clusters}
+
+        # visit the clusters by nearest neighbor on their centers, from the start of the taxi
+        order, position = [], np.asarray(self.taxi_start_position, dtype=float)
+        remaining = set(clusters.tolist())
+        while remaining:
+            nearest = min(remaining, key=lambda c: (((centers[c] - position) ** 2).sum(), c))
+            order.append(nearest)
+            remaining.remove(nearest)
+            position = centers[nearest]
+
+        # a drop whose cluster is visited before the cluster of its pick up moves to the cluster of the pick up if it
+        # is close to it, else to the return pass, which visits the clusters again in reverse order after all of them
+        rank = {c: i for i, c in enumerate(order)}
+        radii = {c: np.sqrt(((points[labels == c] - centers[c]) ** 2).sum(axis=1).max()) for c in clusters}
+        num_of_clusters = int(clusters.max()) + 1
+        station_clusters = np.concatenate(([-1], labels))
+        for pickup in range(1, len(station_clusters), 2):
+            pickup_cluster, drop_cluster = station_clusters[pickup], station_clusters[pickup + 1]
+            if rank[drop_cluster] < rank[pickup_cluster]:
+                drop_point = self.distances.coordinates[pickup + 1]
+                if math.dist(drop_point, centers[pickup_cluster]) <= radii[pickup_cluster] * NEAR_CLUSTER_FACTOR:
+                    station_clusters[pickup + 1] = pickup_cluster
+                else:
+                    station_clusters[pickup + 1] += num_of_clusters
+        returns = set(np.unique(station_clusters[station_clusters >= num_of_clusters]).tolist())
+        for c in reversed(order[:-1]):
+            if c + num_of_clusters in returns:
+                order.append(c + num_of_clusters)
+                centers[c + num_of_clusters] = centers[c]
+        return station_clusters, order, centers
+
+    def build_cluster(self, station_ids):
+        """
+        :param station_ids: the stations of the instance in a cluster
+        :return: the passengers of the cluster and the station id of the instance of every station id of the cluster. A
+        station whose partner is in another cluster becomes a passenger whose pick up and drop are the same point
+        """
+        in_cluster = set(station_ids)
+        passengers, global_ids = [], [START_STATION]
+        for station_id in station_ids:
+            partner = utils.get_partner_station(station_id)
+            if partner in in_cluster and partner < station_id:
+                continue  # added with its pick up
+            point = tuple(self.distances.coordinates[station_id])
+            if partner in in_cluster:
+                passengers.append(build_map.Passenger(len(passengers) + 1, point,
+                                                      tuple(self.distances.coordinates[partner])))
+                global_ids += [station_id, partner]
+            else:
+                passengers.append(build_map.Passenger(len(passengers) + 1, point, point))
+                global_ids += [station_id, station_id]
+        return passengers, global_ids
+
+    def repair_seams(self, route, seams):
+        """
+        first improvement local search on the moves that stay inside a window around every seam, in place
+        :param route: the stitched Route
+        :param seams: the positions in the route where a sub route starts
+        :return: the number of moves that were applied
+        """
+        num_of_moves = 0
+        for seam in seams:
+            window = range(max(1, seam - SEAM_WINDOW), min(len(route), seam + SEAM_WINDOW))
+            # the moves inside the window only touch the stations from the one before it to the one after it
+            distances = _WindowDistances(route[window.start - 1:window.stop + 1], self.distances.coordinates,
+                                         self.distances.provider)
+            improved = True
+            while improved:
+                improved = False
+                for station_index in window:
+                    if self.budget is not None and self.budget.exhausted():
+                        return num_of_moves
+                    for target_index in window:
+                        move = (station_index, target_index)
+                        if utils.is_legal_move(route, move) and \
+                                utils.get_move_delta(route, move, distances) < -utils.EPSILON:
+                            utils.apply_move(route, move)
+                            num_of_moves += 1
+                            improved = True
+        return num_of_moves
+
+    def route_len(self, route):
+        """
+        the length of the route with the distance provider of the instance, measured only on the edges of the route so
+        the full matrix is never computed
+        :param route: a Route
+        """
+        coordinates, station_ids = self.distances.coordinates, np.asarray(route.stations)
+        return float(self.distances.provider.paired(coordinates[station_ids[:-1]], coordinates[station_ids[1:]]).sum())
+
+    @observed
+    def solve(self):
+        """
+
+        :return: the stitched and repaired solution, or the greedy solution if it is shorter (Euclidean distance only)
+        """
+        if not self.list_of_passengers:
+            return self.distances.ids_to_solution([START_STATION])
+        seed = self.seed if self.seed is not None else random.getrandbits(32)
+        rng = np.random.default_rng(seed)
+        with observe_phase(self.observer, 'cluster'):
+            station_clusters, order, centers = self.cluster_stations(rng)
+            tasks, cluster_ids = [], []
+            for i, cluster in enumerate(order):
+                passengers, global_ids = self.build_cluster(np.flatnonzero(station_clusters == cluster).tolist())
+                # the sub routes are solved at the same time, so a sub route starts between the center of the previous
+                # cluster and the center of its own cluster, where the previous sub route is expected to end
+                taxi_start_position = self.taxi_start_position if i == 0 else \
+                    tuple(((centers[order[i - 1]] + centers[cluster]) / 2).tolist())
+                tasks.append((passengers, taxi_start_position, int(rng.integers(2 ** 32))))
+                cluster_ids.append(global_ids)
+
+        with observe_phase(self.observer, 'solve_clusters'):
+            init_args = (self.solve_cluster, self.distances.provider)
+            if self.processes == 1 or len(tasks) == 1:
+                _init_cluster_worker(*init_args)
+                results = list(map(_solve_cluster, tasks))
+            else:
+                with multiprocessing.Pool(self.processes, _init_cluster_worker, init_args) as pool:
+                    results = pool.map(_solve_cluster, tasks)
+
+        with observe_phase(self.observer, 'stitch'):
+            station_ids, seams, visited = [START_STATION], [], set()
+            for local_ids, global_ids in zip(results, cluster_ids):
+                seams.append(len(station_ids))
+                for local_id in local_ids[1:]:
+                    station_id = global_ids[local_id]
+                    if station_id not in visited:  # the second point of a station whose partner is elsewhere
+                        visited.add(station_id)
+                        station_ids.append(station_id)
+            route = Route(station_ids)
+
+        with observe_phase(self.observer, 'repair'):
+            num_of_moves = self.repair_seams(route, seams[1:])
+
+        length = self.route_len(route)
+        if self.distances.provider.euclidean:
+            # the greedy solver finds its route with a grid index, so it never builds the full matrix either
+            with observe_phase(self.observer, 'greedy'):
+                greedy_solution = tps.GreedyTaxiProblemSolver(self.list_of_passengers, self.taxi_start_position,
+                                                              self.distances).solve()
+                greedy_route = Route(self.distances.solution_to_ids(greedy_solution))
+                greedy_length = self.route_len(greedy_route)
+            if greedy_length < length:
+                route, length = greedy_route, greedy_length
+                if self.observer is not None:
+                    self.observer.count('greedy_returned')
+
+        solution = route.to_solution(self.distances)
+        if self.observer is not None:
+            self.observer.count('clusters', len(tasks))
+            self.observer.count('repair_moves', num_of_moves)
+            self.observer.best(length)
+        return solution
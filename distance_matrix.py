@@ -0,0 +1,152 @@
+import functools
+
+import numpy as np
+
+from build_map import PassengerTable
+from distance_providers import EuclideanDistance
+from route_cache import RouteCostCache
+
+START_STATION = 0
+NEAREST_CHUNK = 1024  # rows of distances computed at once by nearest_stations
+
+
+class DistanceMatrix:
+    """
+    The distances between all the stations of an instance of the Taxi Problem, computed once and shared by the
+    solvers. Every station has an integer id: 0 is the start position of the taxi, and the passenger at index k of the
+    list of passengers has its pick up station at 2k + 1 and its drop station at 2k + 2.
+    The distances are computed by a DistanceProvider (Euclidean by default, or Manhattan, haversine or the shortest
+    paths on a road network). The matrix itself is computed on first use, so solvers that only need the coordinates of
+    the stations (like the greedy solver on a huge Euclidean instance) never pay for it.
+    The solvers score whole routes through costs (a RouteCostCache, also created on first use), so a route that is
+    scored again is looked up instead of summed.
+    """
+
+    def __init__(self, list_of_passengers, taxi_start_position, provider=None):
+        """
+
+        :param list_of_passengers: list of passengers of the instance, or a PassengerTable
+        :param taxi_start_position: the start position (coordinate) of the taxi driver
+        :param provider: the DistanceProvider of the distances, EuclideanDistance if not given
+        """
+        self.list_of_passengers = list_of_passengers
+        self.taxi_start_position = taxi_start_position
+        self.provider = provider if provider is not None else EuclideanDistance()
+
+        if isinstance(list_of_passengers, PassengerTable):
+            self.coordinates = list_of_passengers.station_coordinates(taxi_start_position)
+        else:
+            coordinates = [taxi_start_position]
+            for passenger in list_of_passengers:
+                coordinates.append(passenger.start)
+                coordinates.append(passenger.end)
+            self.coordinates = np.array(coordinates, dtype=float).reshape(-1, 2)
+        self.num_of_evaluations = 0  # number of routes and moves that were scored with this matrix
+        self._nearest = {}  # k: the k nearest stations of every station
+
+    @functools.cached_property
+    def matrix(self):
+        """the distances between all the stations, computed by the provider on first use"""
+        return self.provider.distance_matrix(self.coordinates)
+
+    @functools.cached_property
+    def _rows(self):
+        """the rows of the matrix as lists, which are faster than numpy for single lookups"""
+        return self.matrix.tolist()
+
+    @functools.cached_property
+    def costs(self):
+        """the RouteCostCache that scores whole routes"""
+        return RouteCostCache(self)
+
+    @functools.cached_property
+    def _passenger_index(self):
+        """the index in the list of passengers of every passenger id"""
+        if isinstance(self.list_of_passengers, PassengerTable):
+            passenger_ids = self.list_of_passengers.passenger_ids.tolist()
+        else:
+            passenger_ids = [p.passenger_id for p in self.list_of_passengers]
+        return {passenger_id: k for k, passenger_id in enumerate(passenger_ids)}
+
+    def __getstate__(self):
+        # worker processes start with an empty cache of their own
+        state = dict(self.__dict__)
+        state.pop('costs', None)
+        return state
+
+    def __len__(self):
+        return len(self.coordinates)
+
+    def distance(self, a, b):
+        """the distance between the stations with ids a and b"""
+        return self._rows[a][b]
+
+    def nearest_stations(self, k):
+        """
+        the k nearest stations of every station, computed once for every k in chunks of rows, so the full matrix is not
+        needed unless the provider is not cheap
+        :return: a list by station id of the lists of the ids of its k nearest other stations, the nearest first
+        """
+        if k not in self._nearest:
+            num_of_nearest = min(k, len(self) - 1)
+            nearest = []
+            for first in range(0, len(self), NEAREST_CHUNK):
+                rows = self.coordinates[first:first + NEAREST_CHUNK]
+                if self.provider.cheap:
+                    dist = self.provider.pairwise(rows, self.coordinates)
+                else:
+                    dist = self.matrix[first:first + NEAREST_CHUNK].copy()
+                dist[np.arange(len(rows)), np.arange(first, first + len(rows))] = np.inf  # a station is not its own
+                if num_of_nearest == 0:
+                    nearest += [[] for _ in rows]
+                    continue
+                ids = np.argpartition(dist, num_of_nearest - 1, axis=1)[:, :num_of_nearest]
+                order = np.take_along_axis(dist, ids, axis=1).argsort(axis=1, kind='stable')
+                nearest += np.take_along_axis(ids, order, axis=1).tolist()
+            self._nearest[k] = nearest
+        return self._nearest[k]
+
+    def station_id(self, station):
+        """
+        :param station: a station in the solution format ((x, y), passenger_id, is_destination) or the start station
+        ((x, y), 0)
+        :return: the id of the station in the matrix
+        """
+        if station[1] == 0:
+            return START_STATION
+        return 2 * self._passenger_index[station[1]] + 1 + int(station[2])
+
+    def station(self, station_id):
+        """the station in the solution format that matches the given station id"""
+        if station_id == START_STATION:
+            return self.taxi_start_position, 0
+        passenger = self.list_of_passengers[(station_id - 1) // 2]
+        if station_id % 2 == 0:
+            return passenger.end, passenger.passenger_id, True
+        return passenger.start, passenger.passenger_id, False
+
+    def solution_to_ids(self, solution):
+        """converts a solution (list of stations) to a list of station ids"""
+        return [self.station_id(station) for station in solution]
+
+    def ids_to_solution(self, station_ids):
+        """converts a list of station ids back to a solution (list of stations)"""
+        return [self.station(station_id) for station_id in station_ids]
+
+    def get_ids_len(self, station_ids):
+        """
+        the length of the route that visits the given station ids by order. It is looked up in the matrix if the
+        matrix was built (or the provider is not cheap), else the provider measures only the edges of the route, so
+        scoring one route of a huge instance never builds the full matrix
+        """
+        self.num_of_evaluations += 1
+        if len(station_ids) < 2:
+            return 0
+        station_ids = np.asarray(station_ids)
+        if 'matrix' in self.__dict__ or not self.provider.cheap:
+            return float(self.matrix[station_ids[:-1], station_ids[1:]].sum())
+        return float(self.provider.paired(self.coordinates[station_ids[:-1]], self.coordinates[station_ids[1:]]).sum())
+
+    def get_solution_len(self, solution):
+        """the length of the given solution (list of stations)"""
+        return self.get_ids_len(self.solution_to_ids(solution))
@@ -0,0 +1,312 @@
+import collections
+import functools
+import hashlib
+import heapq
+import math
+import multiprocessing
+import os
+
+import numpy as np
+
+from spatial_index import GridIndex
+
+EARTH_RADIUS = 6371.0  # km
+PAIRED_CHUNK = 256  # pairs of points measured at once by the default DistanceProvider.paired
+ROW_CACHE_SIZE = 1024  # source nodes whose Dijkstra distances GraphDistance keeps in memory
+MAX_REPORTED_PAIRS = 5  # pairs of unreachable points in the errors of GraphDistance
+
+_graph = None  # (indptr, indices, weights, target nodes) of a dijkstra worker process
+
+
+class DistanceProvider:
+    """
+    Computes the distances between points, the metric of a DistanceMatrix. Subclasses implement pairwise.
+    'euclidean' is True only for the plane Euclidean metric, which the solvers that use spatial indices (the greedy
+    solver) need. 'cheap' is True if pairwise only does arithmetic on the coordinates, so a chunk of rows can be
+    computed again instead of looking it up in the full matrix.
+    """
+    euclidean = False
+    cheap = True
+
+    def pairwise(self, points_a, points_b):
+        """
+        :param points_a: array of shape (m, 2)
+        :param points_b: array of shape (k, 2)
+        :return: array of shape (m, k) of the distances from every point of points_a to every point of points_b
+        """
+        raise NotImplementedError
+
+    def paired(self, points_a, points_b):
+        """
+        :param points_a: array of shape (m, 2)
+        :param points_b: array of shape (m, 2)
+        :return: array of the m distances from every point of points_a to the point of points_b at the same index. The
+        default takes the diagonals of pairwise on chunks of the pairs
+        """
+        return np.concatenate([np.diagonal(self.pairwise(points_a[first:first + PAIRED_CHUNK],
+                                                         points_b[first:first + PAIRED_CHUNK]))
+                               for first in range(0, len(points_a), PAIRED_CHUNK)] or [np.zeros(0)])
+
+    def distance_matrix(self, points):
+        """the matrix of the distances between all the points, which a DistanceMatrix asks for once"""
+        return self.pairwise(points, points)
+
+    def distance(self, a, b):
+        """the distance from point a to point b"""
+        return float(self.pairwise(np.array([a], dtype=float), np.array([b], dtype=float))[0, 0])
+
+
+class EuclideanDistance(DistanceProvider):
+    euclidean = True
+
+    def pairwise(self, points_a, points_b):
+        diff = points_a[:, np.newaxis, :] - points_b[np.newaxis, :, :]
+        return np.sqrt((diff ** 2).sum(axis=2))
+
+    def paired(self, points_a, points_b):
+        return np.sqrt(((points_a - points_b) ** 2).sum(axis=1))
+
+
+class ManhattanDistance(DistanceProvider):
+    """the length of a path on a grid of streets along the axes"""
+
+    def pairwise(self, points_a, points_b):
+        return np.abs(points_a[:, np.newaxis, :] - points_b[np.newaxis, :, :]).sum(axis=2)
+
+    def paired(self, points_a, points_b):
+        return np.abs(points_a - points_b).sum(axis=1)
+
+
+class HaversineDistance(DistanceProvider):
+    """the great circle distance between points given as (longitude, latitude) in degrees, in km by default"""
+
+    def __init__(self, radius=EARTH_RADIUS):
+        self.radius = radius
+
+    def pairwise(self, points_a, points_b):
+        return self._haversine(points_a[:, np.newaxis, :], points_b[np.newaxis, :, :])
+
+    def paired(self, points_a, points_b):
+        return self._haversine(points_a, points_b)
+
+    def _haversine(self, points_a, points_b):
+        """the distances between the points, broadcast over all the axes but the last (longitude, latitude) one"""
+        lon_a, lat_a = np.radians(points_a[..., 0]), np.radians(points_a[..., 1])
+        lon_b, lat_b = np.radians(points_b[..., 0]), np.radians(points_b[..., 1])
+        h = np.sin((lat_b - lat_a) / 2) ** 2 + np.cos(lat_a) * np.cos(lat_b) * np.sin((lon_b - lon_a) / 2) ** 2
+        return 2 * self.radius * np.arcsin(np.sqrt(np.minimum(h, 1)))
+
+
+def _init_dijkstra_worker(indptr, indices, weights, targets):
+    """keeps the graph in the worker process, so only the sources are sent to it"""
+    global _graph
+    _graph = (indptr, indices, weights, targets)
+
+
+def _dijkstra(indptr, indices, weights, source, targets):
+    """
+    :param targets: set of target nodes
+    :return: dict of the shortest path lengths from the source to the nodes that were settled. The search stops as
+    soon as all the targets are settled, so a target that is not in the dict is unreachable
+    """
+    dist, settled = {source: 0.0}, {}
+    heap = [(0.0, source)]
+    num_of_unsettled_targets = len(targets)
+    while heap and num_of_unsettled_targets:
+        d, node = heapq.heappop(heap)
+        if node in settled:
+            continue
+        settled[node] = d
+        if node in targets:
+            num_of_unsettled_targets -= 1
+        for edge in range(indptr[node], indptr[node + 1]):
+            neighbor, new_dist = indices[edge], d + weights[edge]
+            if new_dist < dist.get(neighbor, math.inf):
+                dist[neighbor] = new_dist
+                heapq.heappush(heap, (new_dist, neighbor))
+    return settled
+
+
+def _dijkstra_rows(sources):
+    """
+    :param sources: list of source nodes
+    :return: list of the rows of the shortest path lengths from every source to the target nodes (inf if unreachable)
+    """
+    indptr, indices, weights, targets = _graph
+    target_set = set(targets)
+    rows = []
+    for source in sources:
+        settled = _dijkstra(indptr, indices, weights, source, target_set)
+        rows.append([settled.get(target, math.inf) for target in targets])
+    return rows
+
+
+class GraphDistance(DistanceProvider):
+    """
+    The length of the shortest path on a road network. The network is an edge list file: a line 'x1 y1 x2 y2 [length]'
+    for every two way street between the nodes at (x1, y1) and (x2, y2), with its Euclidean length if no length is
+    given (empty lines and lines that start with '#' are skipped). Every point is snapped to the nearest node (found
+    with a GridIndex of the nodes), so the distance between two points is the shortest path between their nodes. The
+    streets are two way because the moves of the solvers that reverse a segment of the route assume symmetric
+    distances.
+    distance_matrix (the full matrix of an instance) runs Dijkstra from every distinct node, in parallel worker
+    processes, and saves the matrix to a cache directory, keyed by the network and the nodes, so the same stations are
+    never searched twice. The other queries (pairwise, paired) run Dijkstra in this process and keep the distances
+    each search settled in memory for the ROW_CACHE_SIZE most recently used source nodes, so they never touch the disk.
+    Both raise ValueError if some of the points snap to nodes that are not connected by the network.
+    """
+    cheap = False
+
+    def __init__(self, path, cache_dir=None, processes=None):
+        """
+
+        :param path: the edge list file of the road network
+        :param cache_dir: the directory of the cached matrices, next to the edge list file by default
+        :param processes: number of worker processes of Dijkstra, the number of cpus if None. 1 runs it in this
+        process, and so does a worker process
+        """
+        self.path = path
+        self.cache_dir = cache_dir if cache_dir is not None else os.path.splitext(path)[0] + '_distance_cache'
+        self.processes = processes
+
+        node_ids, sources, targets, lengths = {}, [], [], []
+        with open(path) as f:
+            for line in f:
+                fields = line.split()
+                if not fields or fields[0].startswith('#'):
+                    continue
+                a, b = (float(fields[0]), float(fields[1])), (float(fields[2]), float(fields[3]))
+                sources.append(node_ids.setdefault(a, len(node_ids)))
+                targets.append(node_ids.setdefault(b, len(node_ids)))
+                lengths.append(float(fields[4]) if len(fields) > 4 else math.dist(a, b))
+        sources, targets, lengths = sources + targets, targets + sources, lengths + lengths
+        self.nodes = np.array(list(node_ids), dtype=float).reshape(-1, 2)
+
+        # the edges in compressed sparse rows: the edges of node u are indptr[u]:indptr[u + 1]
+        order = np.argsort(sources, kind='stable')
+        self.indptr = np.concatenate(([0], np.cumsum(np.bincount(sources, minlength=len(self.nodes))))).tolist()
+        self.indices = np.asarray(targets, dtype=int)[order].tolist()
+        self.weights = np.asarray(lengths, dtype=float)[order].tolist()
+        digest = hashlib.sha1(np.asarray(self.indptr).tobytes())
+        digest.update(np.asarray(self.indices).tobytes())
+        digest.update(np.asarray(self.weights).tobytes())
+        self._graph_key = digest.hexdigest()
+        self._settled = collections.OrderedDict()  # source node: {node: distance}, the least recently used first
+
+    def __getstate__(self):
+        # a worker process starts with an empty cache of rows and builds the index of the nodes again
+        state = dict(self.__dict__)
+        state['_settled'] = collections.OrderedDict()
+        state.pop('_node_index', None)
+        return state
+
+    @functools.cached_property
+    def _node_index(self):
+        """a GridIndex of all the nodes of the network"""
+        index = GridIndex(self.nodes.tolist())
+        for node in range(len(self.nodes)):
+            index.insert(node)
+        return index
+
+    def snap(self, points):
+        """:return: array of the nearest node of every point, the smallest node among nodes at the same distance"""
+        return np.array([self._node_index.nearest(x, y) for x, y in np.asarray(points).tolist()], dtype=int)
+
+    def _check_reachable(self, unreachable, points_a, points_b):
+        """
+        raises ValueError if there are unreachable pairs of points
+        :param unreachable: array of the pairs (index in points_a, index in points_b) whose distance is inf
+        """
+        if len(unreachable):
+            pairs = ', '.join('{} {} -> {} {}'.format(i, tuple(points_a[i].tolist()), j, tuple(points_b[j].tolist()))
+                              for i, j in unreachable[:MAX_REPORTED_PAIRS].tolist())
+            more = ', ..' if len(unreachable) > MAX_REPORTED_PAIRS else ''
+            raise ValueError('the road network {} is not connected, {} pairs of points snap to nodes that are '
+                             'unreachable from each other (the index of the point, its station id in a '
+                             'DistanceMatrix, and its coordinates): {}{}'.format(self.path, len(unreachable), pairs,
+                                                                                 more))
+
+    def _row(self, source, targets):
+        """
+        :param targets: set of target nodes
+        :return: dict of the distances from the source node that holds all the reachable targets, from the memory
+        cache if a former search from the source already settled them
+        """
+        settled = self._settled.get(source)
+        if settled is None or not targets.issubset(settled):
+            found = _dijkstra(self.indptr, self.indices, self.weights, source, targets)
+            settled = found if settled is None else {**settled, **found}
+            self._settled[source] = settled
+            if len(self._settled) > ROW_CACHE_SIZE:
+                self._settled.popitem(last=False)
+        self._settled.move_to_end(source)
+        return settled
+
+    def pairwise(self, points_a, points_b):
+        nodes_a, nodes_b = self.snap(points_a).tolist(), self.snap(points_b).tolist()
+        targets = set(nodes_b)
+        rows = {}
+        for source in nodes_a:
+            if source not in rows:
+                settled = self._row(source, targets)
+                rows[source] = [settled.get(target, math.inf) for target in nodes_b]
+        matrix = np.array([rows[source] for source in nodes_a], dtype=float).reshape(len(nodes_a), len(nodes_b))
+        self._check_reachable(np.argwhere(np.isinf(matrix)), points_a, points_b)
+        return matrix
+
+    def paired(self, points_a, points_b):
+        nodes_a, nodes_b = self.snap(points_a).tolist(), self.snap(points_b).tolist()
+        targets = {}  # source node: its target nodes
+        for source, target in zip(nodes_a, nodes_b):
+            targets.setdefault(source, set()).add(target)
+        rows = {source: self._row(source, source_targets) for source, source_targets in targets.items()}
+        distances = np.array([rows[source].get(target, math.inf) for source, target in zip(nodes_a, nodes_b)])
+        unreachable = np.flatnonzero(np.isinf(distances))
+        self._check_reachable(np.stack((unreachable, unreachable), axis=1), points_a, points_b)
+        return distances
+
+    def distance_matrix(self, points):
+        nodes = self.snap(points)
+        digest = hashlib.sha1(self._graph_key.encode())
+        digest.update(nodes.tobytes())
+        cache_path = os.path.join(self.cache_dir, digest.hexdigest() + '.npy')
+        if os.path.exists(cache_path):
+            return np.load(cache_path)
+
+        unique_nodes, node_rows = np.unique(nodes, return_inverse=True)
+        init_args = (self.indptr, self.indices, self.weights, unique_nodes.tolist())
+        processes = self.processes or multiprocessing.cpu_count()
+        chunks = [chunk.tolist() for chunk in np.array_split(unique_nodes, min(len(unique_nodes), processes * 4) or 1)]
+        # a worker process of a solver is a daemon, which can't start processes of its own
+        if processes == 1 or len(chunks) == 1 or multiprocessing.current_process().daemon:
+            _init_dijkstra_worker(*init_args)
+            results = list(map(_dijkstra_rows, chunks))
+        else:
+            with multiprocessing.Pool(processes, _init_dijkstra_worker, init_args) as pool:
+                results = pool.map(_dijkstra_rows, chunks)
+        node_matrix = np.array([row for rows in results for row in rows], dtype=float).reshape(len(unique_nodes),
+                                                                                               len(unique_nodes))
+        node_rows = node_rows.reshape(-1)
+        matrix = node_matrix[node_rows][:, node_rows]
+        self._check_reachable(np.argwhere(np.isinf(matrix)), points, points)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_path = cache_path + '.' + str(os.getpid()) + '.npy'
+        np.save(temp_path, matrix)
+        os.replace(temp_path, cache_path)  # other processes never load a partial file
+        return matrix
+
+
+def get_provider(name, road_network=None):
+    """
+    :param name: 'euclidean', 'manhattan', 'haversine' or 'graph'
+    :param road_network: the edge list file of the 'graph' provider
+    """
+    if name == 'graph':
+        if road_network is None:
+            raise ValueError('the graph distance needs a road network file')
+        return GraphDistance(road_network)
+    providers = {'euclidean': EuclideanDistance, 'manhattan': ManhattanDistance, 'haversine': HaversineDistance}
+    if name not in providers:
+        raise ValueError('unknown distance ' + str(name))
+    return providers[name]()
@@ -1,8 +1,11 @@
 import itertools
 import random
+import numpy as np
 import utils
 import taxi_problem_solver as tps
+from distance_matrix import DistanceMatrix
 from genetic_funcs_interface import GeneticFuncsInterface
+from solver_observer import observed, observe_phase
 
 SIZE_OF_POPULATION = 20  # must be an even number
 
@@ -13,17 +16,22 @@ class GeneticTaxiProblemSolver:
     solutions for the optimization problem is considered as a population of individuals.
     The degree of adaptation of an individual to its environment is specified by its fitness.
     """
+    observer = None  # a SolverObserver that collects counters while solving
+    budget = None  # a SolverBudget that limits the work of solve
 
-    def __init__(self, list_of_passengers, taxi_start_position, funcs: GeneticFuncsInterface):
+    def __init__(self, list_of_passengers, taxi_start_position, funcs: GeneticFuncsInterface, distances=None):
         """
 
         :param list_of_passengers: list of passengers to try find a good rout between
         :param taxi_start_position: the start position (coordinate) of the taxi driver
         :param funcs: interface that include crossover function and mutation function
+        :param distances: DistanceMatrix of the instance, built from the passengers if not given
         """
         self.list_of_passengers = list_of_passengers
         self.taxi_start_position = taxi_start_position
         self._funcs = funcs
+        self.distances = distances if distances is not None else DistanceMatrix(list_of_passengers,
+                                                                                taxi_start_position)
 
     def __str__(self):
         return 'Genetic Algorithm'
@@ -35,11 +43,12 @@ class GeneticTaxiProblemSolver:
         """
         population = []
         for i in range(SIZE_OF_POPULATION):
-            rand = tps.RandomTaxiProblemSolver(self.list_of_passengers, (0, 0), None)
+            rand = tps.RandomTaxiProblemSolver(self.list_of_passengers, self.taxi_start_position, None, self.distances)
             solution_random = rand.solve()
             population.append(solution_random)
         return population
 
+    @observed
     def solve(self, num_iteration=400, prob_to_mut=0.05):
         """
 
@@ -48,36 +57,177 @@ class GeneticTaxiProblemSolver:
         :param prob_to_mut: probability to execute mutation on a child
         :return: the best path and its length
         """
-        population = self.init_population()
+        observer = self.observer
+        with observe_phase(observer, 'init_population'):
+            population = self.init_population()
         best_sol, best_length = population[0], utils.MAX_INT
         for generation in range(num_iteration):
-            lengths = [utils.get_solution_len(sol) for sol in population]  # lengths of all solutions
+            lengths = [self.distances.costs.solution_len(sol) for sol in population]  # lengths of all solutions
             lengths.sort()
             if (max(lengths) / min(lengths)) < 1.02:
                 break
-            for i in range(SIZE_OF_POPULATION):
+            for i in range(len(lengths)):
                 if lengths[i] < best_length:
                     best_sol, best_length = population[i], lengths[i]
+            if observer is not None:
+                observer.count('generations')
+                observer.best(best_length)
+            if self.budget is not None and self.budget.exhausted():
+                break
 
-            # selected = [selection(population, lengths) for _ in range(SIZE_OF_POPULATION)]
-            inx = list(itertools.combinations(range(SIZE_OF_POPULATION), 2))
-            random.shuffle(inx)
-
-            children = list()
-            for i in range(0, SIZE_OF_POPULATION):
-                p1, p2 = population[inx[i][0]], population[inx[i][1]]
-                for child in self._funcs.crossover(p1, p2):
-                    child = self._funcs.mutation(child, prob_to_mut)
-                    children.append(child)
-
-            population += children
-            population.sort(key=lambda x: utils.get_solution_len(x))
-            tmp, cur_len = [population[0]], utils.get_solution_len(population[0])
-            for candidate in population:
-                candidate_len = utils.get_solution_len(candidate)
-                if candidate_len != cur_len:
-                    cur_len = candidate_len
-                    tmp.append(candidate)
-            population = tmp[:SIZE_OF_POPULATION]
+            with observe_phase(observer, 'next_generation'):
+                population = self.next_generation(population, prob_to_mut)
 
         return best_sol, best_length
+
+    def next_generation(self, population, prob_to_mut):
+        """
+
+        :param population: list of solutions
+        :param prob_to_mut: probability to execute mutation on a child
+        :return: the best SIZE_OF_POPULATION solutions with different lengths among the population and its children,
+        sorted by length
+        """
+        # selected = [selection(population, lengths) for _ in range(SIZE_OF_POPULATION)]
+        inx = list(itertools.combinations(range(len(population)), 2))
+        random.shuffle(inx)
+
+        children = list()
+        for i1, i2 in inx[:SIZE_OF_POPULATION]:
+            p1, p2 = population[i1], population[i2]
+            for child in self._funcs.crossover(p1, p2):
+                child = self._funcs.mutation(child, prob_to_mut)
+                children.append(child)
+
+        population = population + children
+        lengths = [self.distances.costs.solution_len(x) for x in population]
+        tmp, cur_len = [], None
+        for i in sorted(range(len(population)), key=lengths.__getitem__):
+            if lengths[i] != cur_len:
+                cur_len = lengths[i]
+                tmp.append(population[i])
+        return tmp[:SIZE_OF_POPULATION]
+
+
+class VectorizedGeneticTaxiProblemSolver:
+    """
+    The genetic algorithm on a population stored as a matrix of station ids (a row for every solution), so the fitness,
+    the selection, the crossover and the mutation of the whole population are array operations.
+    The child sorts the stations by a weighted average of their positions in the two parents, with one weight for both
+    stations of a passenger, so a pick up station always stays before its drop station. Mutation shifts both stations
+    of a random passenger by the same amount.
+    """
+    observer = None  # a SolverObserver that collects counters while solving
+    budget = None  # a SolverBudget that limits the work of solve
+
+    def __init__(self, list_of_passengers, taxi_start_position, size_of_population=1000, distances=None, seed=None):
+        """
+
+        :param list_of_passengers: list of passengers to try find a good rout between
+        :param taxi_start_position: the start position (coordinate) of the taxi driver
+        :param size_of_population: number of solutions in every generation
+        :param distances: DistanceMatrix of the instance, built from the passengers if not given
+        :param seed: seed of the numpy random generator, drawn from the random module if not given
+        """
+        self.list_of_passengers = list_of_passengers
+        self.taxi_start_position = taxi_start_position
+        self.size_of_population = size_of_population
+        self.distances = distances if distances is not None else DistanceMatrix(list_of_passengers,
+                                                                                taxi_start_position)
+        self.rng = np.random.default_rng(seed if seed is not None else random.getrandbits(64))
+
+    def __str__(self):
+        return 'Vectorized Genetic Algorithm'
+
+    @staticmethod
+    def routes_from_keys(keys):
+        """
+        :param keys: matrix with a row of keys for every route, column j is the key of station j + 1
+        :return: matrix of routes that start at the start station and visit the stations by the order of their keys
+        """
+        routes = np.argsort(keys, axis=1, kind='stable') + 1
+        return np.hstack([np.zeros((len(keys), 1), dtype=routes.dtype), routes])
+
+    @staticmethod
+    def positions(population):
+        """matrix of the position of every station id in every route"""
+        positions = np.empty_like(population)
+        positions[np.arange(len(population))[:, np.newaxis], population] = np.arange(population.shape[1])
+        return positions
+
+    def init_population(self, size):
+        """
+
+        :return: a matrix of 'size' random solutions
+        """
+        keys = self.rng.random((size, len(self.list_of_passengers), 2))
+        keys.sort(axis=2)  # the key of the pick up station is smaller than the key of the drop station
+        return self.routes_from_keys(keys.reshape(size, -1))
+
+    def fitness(self, population):
+        """the lengths of all the routes of the population at once"""
+        self.distances.num_of_evaluations += len(population)
+        return self.distances.matrix[population[:, :-1], population[:, 1:]].sum(axis=1)
+
+    def selection(self, lengths, size):
+        """indices of 'size' winners of tournaments between two random solutions"""
+        a, b = self.rng.integers(0, len(lengths), size), self.rng.integers(0, len(lengths), size)
+        return np.where(lengths[a] <= lengths[b], a, b)
+
+    def crossover(self, parents1, parents2, prob_to_mut):
+        """
+
+        :param parents1: matrix of first parents
+        :param parents2: matrix of second parents
+        :param prob_to_mut: probability to execute mutation on a child
+        :return: matrix of children, one for every pair of parents
+        """
+        size, num_of_passengers = len(parents1), len(self.list_of_passengers)
+        weights = np.repeat(self.rng.random((size, num_of_passengers)), 2, axis=1)
+        keys = weights * self.positions(parents1)[:, 1:] + (1 - weights) * self.positions(parents2)[:, 1:]
+
+        mutated = np.flatnonzero(self.rng.random(size) < prob_to_mut)
+        passengers = self.rng.integers(0, num_of_passengers, len(mutated))
+        shifts = self.rng.uniform(-keys.shape[1], keys.shape[1], len(mutated))
+        keys[mutated, 2 * passengers] += shifts
+        keys[mutated, 2 * passengers + 1] += shifts
+        return self.routes_from_keys(keys)
+
+    @observed
+    def solve(self, num_iteration=400, prob_to_mut=0.05):
+        """
+
+        :param num_iteration: how many generation to run before the algorithm stops
+        :param prob_to_mut: probability to execute mutation on a child
+        :return: the best path and its length
+        """
+        observer = self.observer
+        if not self.list_of_passengers:
+            return self.distances.ids_to_solution([0]), 0
+        size = self.size_of_population
+        population = self.init_population(size)
+        lengths = self.fitness(population)
+        for generation in range(num_iteration):
+            if (lengths.max() / lengths.min()) < 1.02:
+                break
+            if self.budget is not None and self.budget.exhausted():
+                break
+            if observer is not None:
+                observer.count('generations')
+                observer.best(float(lengths.min()))
+            children = self.crossover(population[self.selection(lengths, size)],
+                                      population[self.selection(lengths, size)], prob_to_mut)
+
+            population = np.vstack([population, children])
+            lengths = np.concatenate([lengths, self.fitness(children)])
+            # sort by length and keep one solution of every length
+            _, unique = np.unique(lengths, return_index=True)
+            unique = unique[:size]
+            population, lengths = population[unique], lengths[unique]
+            if len(population) < size:
+                immigrants = self.init_population(size - len(population))
+                population = np.vstack([population, immigrants])
+                lengths = np.concatenate([lengths, self.fitness(immigrants)])
+
+        best = int(lengths.argmin())
+        return self.distances.ids_to_solution(population[best].tolist()), float(lengths[best])
@@ -1,14 +1,8 @@
-from random import random, randint, choice
+from random import random, randint
 
 import utils
 
 
-def get_other_station_from_solution(solution, passenger_id):
-    for sid, s in enumerate(solution):
-        if passenger_id == s[1]:
-            return sid
-
-
 def find_matches(p1, p2):
     matches = [False] * len(p1)
     for i in range(1, len(p1) - 1):
@@ -77,5 +71,5 @@ def crossover(p1, p2):
 
 def mutation_keep_sorted(sol, mut_prob):
     if random() < mut_prob:
-        return choice(utils.get_set_of_neighbors(sol))
+        return utils.get_random_neighbor(sol)
     return sol
\ No newline at end of file
@@ -1,4 +1,4 @@
-from random import random, choice
+from random import random
 import utils
 
 
@@ -44,5 +44,5 @@ def crossover_keep_sorted(p1, p2):
 
 def mutation_keep_sorted(sol, mut_prob):
     if random() < mut_prob:
-        return choice(utils.get_set_of_neighbors(sol))
+        return utils.get_random_neighbor(sol)
     return sol
@@ -0,0 +1,149 @@
+import numpy as np
+
+from build_map import PassengerTable
+
+VERSION = 1
+INSTANCES_MAGIC = b'TAXIINST'
+ROUTES_MAGIC = b'TAXIROUT'
+ALIGNMENT = 8  # every array starts at a multiple of this many bytes
+
+# the file starts with the header, then the arrays of the items, then the index: a record for every item
+HEADER = np.dtype([('magic', 'S8'), ('version', '<u4'), ('reserved', '<u4'), ('num_of_items', '<u8'),
+                   ('index_offset', '<u8')])
+INSTANCE_RECORD = np.dtype([('offset', '<u8'), ('num_of_passengers', '<u8'), ('taxi_x', '<f8'), ('taxi_y', '<f8')])
+ROUTE_RECORD = np.dtype([('offset', '<u8'), ('num_of_stations', '<u8')])
+PASSENGER = np.dtype([('passenger_id', '<i8'), ('start_x', '<f8'), ('start_y', '<f8'), ('end_x', '<f8'),
+                      ('end_y', '<f8')])
+STATION = np.dtype('<i4')
+
+
+def _write(path, magic, record_dtype, items):
+    """
+    writes the header, the arrays and the index. The index is written last, so the items can come from a generator
+    and only one of them is held in memory
+    :param items: iterable of (record fields without the offset, array)
+    :return: the number of items that were written
+    """
+    records = []
+    with open(path, 'wb') as f:
+        f.write(np.zeros(1, HEADER).tobytes())
+        for fields, array in items:
+            f.write(bytes(-f.tell() % ALIGNMENT))
+            records.append((f.tell(),) + fields)
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.write(bytes(-f.tell() % ALIGNMENT))
+        index_offset = f.tell()
+        f.write(np.array(records, dtype=record_dtype).tobytes())
+        f.seek(0)
+        f.write(np.array([(magic, VERSION, 0, len(records), index_offset)], dtype=HEADER).tobytes())
+    return len(records)
+
+
+class _MappedFile:
+    """
+    a file of the format of _write, mapped to memory with numpy.memmap. Nothing is read before it is used, and the
+    pages of the file are shared by all the processes that map it. When it is pickled (sent to a worker process) only
+    its path is sent, and the worker maps the file again
+    """
+    magic = None
+    record_dtype = None
+
+    def __init__(self, path):
+        self.path = path
+        self._data = np.memmap(path, dtype=np.uint8, mode='r')
+        header = self._data[:HEADER.itemsize].view(HEADER)[0]
+        if header['magic'] != self.magic:
+            raise ValueError(str(path) + ' is not a file of ' + self.magic.decode())
+        if header['version'] != VERSION:
+            raise ValueError('unsupported version ' + str(header['version']) + ' of ' + str(path))
+        index_offset = int(header['index_offset'])
+        self.records = self._data[index_offset:index_offset + int(header['num_of_items']) * self.record_dtype.itemsize]\
+            .view(self.record_dtype)
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def __len__(self):
+        return len(self.records)
+
+    def _array(self, offset, dtype, count):
+        """a view of count items of dtype from offset of the file, without a copy"""
+        return self._data[offset:offset + count * dtype.itemsize].view(dtype)
+
+
+def save_instances(path, instances):
+    """
+    :param path: the file to write
+    :param instances: iterable of (list of passengers or PassengerTable, taxi start position)
+    :return: the number of instances that were written
+    """
+    def items():
+        for list_of_passengers, taxi_start_position in instances:
+            if not isinstance(list_of_passengers, PassengerTable):
+                list_of_passengers = PassengerTable.from_passengers(list_of_passengers)
+            rows = np.empty(len(list_of_passengers), dtype=PASSENGER)
+            rows['passenger_id'] = list_of_passengers.passenger_ids
+            rows['start_x'], rows['start_y'] = list_of_passengers.start_x, list_of_passengers.start_y
+            rows['end_x'], rows['end_y'] = list_of_passengers.end_x, list_of_passengers.end_y
+            yield (len(rows), taxi_start_position[0], taxi_start_position[1]), rows
+    return _write(path, INSTANCES_MAGIC, INSTANCE_RECORD, items())
+
+
+class InstanceFile(_MappedFile):
+    """
+    The instances of a file written by save_instances. instance_file[i] is a PassengerTable whose columns are views of
+    the mapped file (so it is never copied or parsed) and the taxi start position. The coordinates are stored as
+    float64, so passengers with int coordinates come back with the same values as floats
+    """
+    magic = INSTANCES_MAGIC
+    record_dtype = INSTANCE_RECORD
+
+    def __getitem__(self, index):
+        record = self.records[index]
+        rows = self._array(int(record['offset']), PASSENGER, int(record['num_of_passengers']))
+        table = PassengerTable(rows['passenger_id'], rows['start_x'], rows['start_y'], rows['end_x'], rows['end_y'])
+        return table, (float(record['taxi_x']), float(record['taxi_y']))
+
+    def passengers(self, index):
+        """the passengers of the instance as a list of Passenger, and the taxi start position"""
+        table, taxi_start_position = self[index]
+        return table.to_passengers(), taxi_start_position
+
+
+def save_routes(path, routes):
+    """
+    :param path: the file to write
+    :param routes: iterable of routes, each a Route or a list of station ids (see DistanceMatrix)
+    :return: the number of routes that were written
+    """
+    def items():
+        for route in routes:
+            station_ids = np.asarray(route.stations if hasattr(route, 'stations') else route, dtype=STATION)
+            yield (len(station_ids),), station_ids
+    return _write(path, ROUTES_MAGIC, ROUTE_RECORD, items())
+
+
+def save_solutions(path, solutions, distances):
+    """
+    converts solutions (lists of [((x, y), passenger_id, is_destination), .. ]) to station ids and saves them
+    :param distances: iterable of the DistanceMatrix of the instance of every solution
+    """
+    return save_routes(path, (d.solution_to_ids(solution) for solution, d in zip(solutions, distances)))
+
+
+class RouteFile(_MappedFile):
+    """The routes of a file written by save_routes. route_file[i] is an int32 array of station ids, a view of the file
+    """
+    magic = ROUTES_MAGIC
+    record_dtype = ROUTE_RECORD
+
+    def __getitem__(self, index):
+        record = self.records[index]
+        return self._array(int(record['offset']), STATION, int(record['num_of_stations']))
+
+    def solution(self, index, distances):
+        """the route as a solution (list of [((x, y), passenger_id, is_destination), .. ])"""
+        return distances.ids_to_solution(self[index].tolist())
@@ -0,0 +1,169 @@
+import multiprocessing
+import random
+import utils
+from distance_matrix import DistanceMatrix, START_STATION
+from genetic_algorithm_solver import GeneticTaxiProblemSolver
+from genetic_funcs_interface import GeneticFuncsInterface
+from solver_observer import observed, observe_phase
+
+_island_solver = None  # the GeneticTaxiProblemSolver of a worker process
+
+
+def _init_island_worker(list_of_passengers, taxi_start_position, funcs, distances):
+    """builds the solver of the worker process once, so only the populations are sent to it"""
+    global _island_solver
+    _island_solver = GeneticTaxiProblemSolver(list_of_passengers, taxi_start_position, funcs, distances)
+
+
+def _evolve_island(task):
+    """
+    runs the genetic algorithm on one island
+    :param task: (population or None for a new random one, number of generations, probability to mutate, seed,
+    SolverBudget of the island or None)
+    :return: the population sorted by length, the lengths, True if the population converged, the number of
+    generations that ran and the number of evaluations the island used
+    """
+    population, num_generations, prob_to_mut, seed, budget = task
+    with utils.seeded_random(seed):
+        return _evolve(population, num_generations, prob_to_mut, budget)
+
+
+def _evolve(population, num_generations, prob_to_mut, budget):
+    """the body of _evolve_island, with the random module already seeded"""
+    first_evaluation = _island_solver.distances.num_of_evaluations
+    _island_solver.budget = budget
+    if budget is not None:
+        budget.start(_island_solver)
+    if population is None:
+        population = _island_solver.init_population()
+    converged, generations_run = False, 0
+    for generation in range(num_generations):
+        lengths = [_island_solver.distances.costs.solution_len(sol) for sol in population]
+        if max(lengths) < min(lengths) * 1.02:  # no division, the lengths may be 0
+            converged = True
+            break
+        if budget is not None and budget.exhausted():
+            break
+        population = _island_solver.next_generation(population, prob_to_mut)
+        generations_run += 1
+    population.sort(key=_island_solver.distances.costs.solution_len)
+    lengths = [_island_solver.distances.costs.solution_len(sol) for sol in population]
+    if budget is not None:
+        budget.finish()
+    evaluations = _island_solver.distances.num_of_evaluations - first_evaluation
+    return population, lengths, converged, generations_run, evaluations
+
+
+class IslandGeneticTaxiProblemSolver:
+    """
+    Runs the genetic algorithm on several populations (islands) in parallel worker processes. Every
+    'migration_interval' generations the best solutions of every island migrate to the next island on a ring and
+    replace its worst solutions. The algorithm stops when all the islands converged or after 'num_iteration'
+    generations.
+    """
+    observer = None  # a SolverObserver that collects counters while solving
+    budget = None  # a SolverBudget that limits the work of solve
+
+    def __init__(self, list_of_passengers, taxi_start_position, funcs: GeneticFuncsInterface, num_of_islands=8,
+                 migration_interval=20, num_of_migrants=2, migration_step=1, processes=None, distances=None):
+        """
+
+        :param list_of_passengers: list of passengers to try find a good rout between
+        :param taxi_start_position: the start position (coordinate) of the taxi driver
+        :param funcs: interface that include crossover function and mutation function
+        :param num_of_islands: number of populations
+        :param migration_interval: number of generations between migrations
+        :param num_of_migrants: number of best solutions every island sends
+        :param migration_step: island i sends its migrants to island (i + migration_step) % num_of_islands
+        :param processes: number of worker processes, the number of cpus if None. 1 runs the islands in this process
+        :param distances: DistanceMatrix of the instance, built from the passengers if not given
+        """
+        self.list_of_passengers = list_of_passengers
+        self.taxi_start_position = taxi_start_position
+        self._funcs = funcs
+        self.num_of_islands = num_of_islands
+        self.migration_interval = migration_interval
+        self.num_of_migrants = num_of_migrants
+        self.migration_step = migration_step
+        self.processes = processes
+        self.distances = distances if distances is not None else DistanceMatrix(list_of_passengers,
+                                                                                taxi_start_position)
+
+    def __str__(self):
+        return 'Island Genetic Algorithm'
+
+    def _island_budget(self):
+        """
+        the budget of an island for the next migration interval: the islands run at the same time, so every island
+        gets an equal share of the evaluations that are left (see SolverBudget.for_task)
+        """
+        if self.budget is None:
+            return None
+        remaining = self.budget.remaining_evaluations()
+        return self.budget.for_task(remaining // self.num_of_islands if remaining is not None else None)
+
+    def migrate(self, islands):
+        """
+        moves copies of the best solutions of every island to the next island on the ring, in place
+        :param islands: list of (population sorted by length, lengths) for every island
+        """
+        migrants = [(population[:self.num_of_migrants], lengths[:self.num_of_migrants])
+                    for population, lengths in islands]
+        for i, (solutions, solutions_lengths) in enumerate(migrants):
+            population, lengths = islands[(i + self.migration_step) % len(islands)]
+            for solution, length in zip(solutions, solutions_lengths):
+                if length in lengths or length >= lengths[-1]:
+                    continue
+                population[-1], lengths[-1] = solution, length
+                order = sorted(range(len(population)), key=lambda j: lengths[j])
+                population[:] = [population[j] for j in order]
+                lengths[:] = [lengths[j] for j in order]
+
+    @observed
+    def solve(self, num_iteration=400, prob_to_mut=0.05):
+        """
+
+        :param num_iteration: how many generation to run on every island before the algorithm stops
+        :param prob_to_mut: probability to execute mutation on a child
+        :return: the best path and its length
+        """
+        if not self.list_of_passengers:
+            return self.distances.ids_to_solution([START_STATION]), 0
+        init_args = (self.list_of_passengers, self.taxi_start_position, self._funcs, self.distances)
+        if self.processes == 1:
+            _init_island_worker(*init_args)
+            pool, map_func = None, map
+        else:
+            pool = multiprocessing.Pool(self.processes, _init_island_worker, init_args)
+            map_func = pool.map
+
+        try:
+            islands = [(None, None)] * self.num_of_islands
+            for first_generation in range(0, num_iteration, self.migration_interval):
+                num_generations = min(self.migration_interval, num_iteration - first_generation)
+                tasks = [(population, num_generations, prob_to_mut, random.getrandbits(32), self._island_budget())
+                         for population, _ in islands]
+                with observe_phase(self.observer, 'evolve'):
+                    results = list(map_func(_evolve_island, tasks))
+                if pool is not None:  # in this process the islands already counted them in the shared matrix
+                    self.distances.num_of_evaluations += sum(result[4] for result in results)
+                islands = [(population, lengths) for population, lengths, _, _, _ in results]
+                if self.observer is not None:
+                    self.observer.count('generations', sum(result[3] for result in results))
+                    self.observer.best(min(lengths[0] for _, lengths in islands))
+                if all(converged for _, _, converged, _, _ in results):
+                    break
+                # an island that stopped early without converging ran out of budget in its worker
+                if self.budget is not None and (self.budget.exhausted() or any(
+                        not converged and generations_run < num_generations
+                        for _, _, converged, generations_run, _ in results)):
+                    break
+                with observe_phase(self.observer, 'migrate'):
+                    self.migrate(islands)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        best_population, best_lengths = min(islands, key=lambda island: island[1][0])
+        return best_population[0], best_lengths[0]
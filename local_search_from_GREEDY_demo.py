@@ -55,7 +55,7 @@ def demo_local_search_with_greedy_as_baseline(passengers):
     solution_greedy = rand.solve()
 
 
-    local_search = LOCAL_SEARCH(passengers, (0, 0), solution_greedy)
+    local_search = LOCAL_SEARCH(passengers, (0, 0), solution_greedy, record_steps=True)
     _, steps_for_demo = local_search.solve()
 
     # print('first: ', steps_for_demo[0][-1])
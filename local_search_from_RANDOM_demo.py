@@ -51,7 +51,7 @@ def demo_local_search_with_random_as_baseline(passengers):
     rand = RANDOM(passengers, (0, 0), None)
     solution_greedy = rand.solve()
 
-    local_search = LOCAL_SEARCH(passengers, (0, 0), solution_greedy)
+    local_search = LOCAL_SEARCH(passengers, (0, 0), solution_greedy, record_steps=True)
     _, steps_for_demo = local_search.solve()
 
     fig = plt.figure()
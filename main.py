@@ -1,19 +1,28 @@
 import argparse
+import cProfile
+import json
+import pstats
+import tracemalloc
 import taxi_problem_solver as tps
 import build_map
 import genetic_algorithm_solver as gf
+import island_genetic_solver as igs
+import cluster_solver as cs
 import random
-from local_search_from_RANDOM_demo import demo_local_search_with_random_as_baseline
 import utils
-
-import matplotlib.pyplot as plt
+from distance_matrix import DistanceMatrix
+from distance_providers import get_provider
 import genetic_functions_keep_sorted as gf_keep_sorted
+import instance_file
 
 from genetic_funcs_interface import GeneticFuncsInterface
+from solver_budget import SolverBudget
+from solver_observer import SolverObserver
 
 EPSILON = 0.0000001
 
 BRUTE_FORCE = tps.BruteForcePruningSolver
+DYNAMIC_PROGRAMMING = tps.DynamicProgrammingSolver
 GREEDY = tps.GreedyTaxiProblemSolver
 RANDOM = tps.RandomTaxiProblemSolver
 
@@ -22,32 +31,65 @@ HILL_CLIMBING = tps.HillClimbingTaxiProblemSolver
 LOCAL_SEARCH = tps.LocalSearchTaxiProblemSolver
 BEAM = tps.BeamLocalSearchTaxiProblemSolver
 MULTIPLE = tps.MultipleLocalSearchTaxiProblemSolver
+TABU_SEARCH = tps.TabuSearchTaxiProblemSolver
 
 GENETIC = gf.GeneticTaxiProblemSolver
+VECTORIZED_GENETIC = gf.VectorizedGeneticTaxiProblemSolver
+ISLAND_GENETIC = igs.IslandGeneticTaxiProblemSolver
+
+CLUSTER = cs.ClusterTaxiProblemSolver
 
 DEFAULT_SEED = 5
 DEFAULT_NUM_OF_PASSENGERS = 20
-
-
-def plot_solution(solution):
-    """plots the given solution. Pick up stations in blue, drop stations in red"""
-    fig = plt.figure()
-    ax = fig.add_subplot(111)
-
-    x, y, z = [p[0][0] for p in solution], [p[0][1] for p in solution], [p[1] for p in solution]
-    ax.plot(x, y, 'b-')
-
-    for i in range(len(x)):
-        ax.annotate(str(z[i]), (x[i], y[i]), textcoords="offset points", xytext=(0, 10), ha='center')
-
-    x_u, y_u = [p[0][0] for p in solution[1:] if not p[2]], [p[0][1] for p in solution[1:] if not p[2]]
-    x_d, y_d = [p[0][0] for p in solution[1:] if p[2]], [p[0][1] for p in solution[1:] if p[2]]
-    ax.plot(x_u, y_u, 'bo')
-    ax.plot(x_d, y_d, 'rs')
-
-    cur_dist = utils.get_solution_len(solution)
-    ax.set_title("Solution Length: " + str(round(cur_dist, 2)))
-    plt.show()
+PROFILE_TOP = 20  # number of functions and allocation sites in the profile
+
+
+def run_solver(alg, args, *solve_args):
+    """
+    runs alg.solve(*solve_args), with a budget if a time limit or a maximal number of evaluations was given. If
+    profile is set, the solver runs with an observer, cProfile and tracemalloc and their summaries are printed
+    """
+    if args.time_limit is not None or args.max_evaluations is not None:
+        alg.budget = SolverBudget(args.time_limit, args.max_evaluations)
+    if not args.profile:
+        return alg.solve(*solve_args)
+
+    alg.observer = SolverObserver()
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    profiler.enable()
+    result = alg.solve(*solve_args)
+    profiler.disable()
+    _, peak_memory = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    summary = alg.observer.summary()
+    print('solver:', alg)
+    print('counters:', summary['counters'])
+    print('phase times:', summary['phase_times'])
+    print('best length:', summary['best_length'], 'after', len(summary['trajectory']), 'improvements')
+    pstats.Stats(profiler).sort_stats('cumulative').print_stats(PROFILE_TOP)
+    print('peak memory:', peak_memory, 'bytes')
+    for stat in snapshot.statistics('lineno')[:PROFILE_TOP]:
+        print(stat)
+    return result
+
+
+def output_solution(solution, args, distances):
+    """prints the solution, saves it to the output file if one was given and plots it unless plotting is off"""
+    print(solution)
+    if args.output:
+        # measured before the file is opened, so a failure does not truncate an existing output
+        length = utils.get_solution_len(solution, distances)
+        with open(args.output, 'w') as f:
+            json.dump({'algorithm': args.algorithm, 'num_of_passengers': args.num_of_passengers,
+                       'random_seed': args.random_seed, 'length': length, 'solution': solution}, f)
+    if args.save_route:
+        instance_file.save_solutions(args.save_route, [solution], [distances])
+    if not args.no_plot:
+        import plotting  # matplotlib is slow to import, so headless runs never load it
+        plotting.plot_solution(solution)
 
 
 def main():
@@ -56,63 +98,124 @@ def main():
                         default=DEFAULT_NUM_OF_PASSENGERS, type=int)
     parser.add_argument('-s', '--random_seed', help='The seed for the passengers stations.', default=DEFAULT_SEED,
                         type=int)
+    parser.add_argument('--distribution', choices=['uniform', 'hotspot'],
+                        help='Draw the passengers into a PassengerTable with this distribution (vectorized, for huge '
+                             'instances) instead of one by one.', default=None, type=str)
     algorithms = ['Greedy', 'LocalSearch', 'HillClimbing', 'SimulatedAnnealing', 'BeamLocalSearch', 'Multiple',
-                  'Genetic', 'BruteForce']
+                  'TabuSearch', 'Genetic', 'VectorizedGenetic', 'IslandGenetic', 'Cluster', 'BruteForce',
+                  'DynamicProgramming']
     parser.add_argument('-a', '--algorithm', choices=algorithms, help='choose which algorithm to run.',
                         default=algorithms[0], type=str)
 
+    parser.add_argument('-i', '--islands', help='Number of populations for IslandGenetic.', default=8, type=int)
+    parser.add_argument('-p', '--processes', help='Number of worker processes for Multiple, IslandGenetic and Cluster, '
+                                                  'all the cpus by default.', default=None, type=int)
+
+    parser.add_argument('--or_opt', help='LocalSearch, HillClimbing, SimulatedAnnealing, Multiple and TabuSearch also '
+                                         'move segments of 2-3 stations.', action='store_true')
+    parser.add_argument('-k', '--k_nearest', help='LocalSearch and HillClimbing only move a station next to one of its '
+                                                  'k nearest stations.', default=None, type=int)
+
+    parser.add_argument('--distance', choices=['euclidean', 'manhattan', 'haversine', 'graph'],
+                        help='The distance between stations, graph is the shortest path on the road network.',
+                        default='euclidean', type=str)
+    parser.add_argument('--road_network', help='Edge list file of the road network of the graph distance.', type=str)
+
+    parser.add_argument('-t', '--time_limit', help='Seconds before the solver returns its best solution so far.',
+                        default=None, type=float)
+    parser.add_argument('--max_evaluations', help='Evaluations before the solver returns its best solution so far.',
+                        default=None, type=int)
+
+    parser.add_argument('--profile', help='Print the solver counters, a cProfile and a tracemalloc summary.',
+                        action='store_true')
+
+    parser.add_argument('--no_plot', help='Do not plot the solution.', action='store_true')
+    parser.add_argument('-o', '--output', help='Save the solution and its length to this JSON file.', type=str)
+    parser.add_argument('--save_route', help='Save the station ids of the solution to this binary route file.',
+                        type=str)
+
+    parser.add_argument('--instance', help='Load the passengers and the taxi start position from this binary instance '
+                                           'file instead of drawing them.', type=str)
+    parser.add_argument('--instance_index', help='The instance to load from the instance file.', default=0, type=int)
+    parser.add_argument('--save_instance', help='Save the passengers to this binary instance file.', type=str)
+
     parser.add_argument('-d', '--demo', help='Run demo on Local Search over random solution.', action='store_true')
 
     args = parser.parse_args()
     random.seed(args.random_seed)
-    passengers = build_map.build_map_of_passengers(args.num_of_passengers)
+    taxi_start_position = (0, 0)
+    if args.instance:
+        passengers, taxi_start_position = instance_file.InstanceFile(args.instance)[args.instance_index]
+        args.num_of_passengers = len(passengers)
+    elif args.distribution is not None:
+        passengers = build_map.generate_passenger_table(args.num_of_passengers, args.distribution, args.random_seed)
+    else:
+        passengers = build_map.build_map_of_passengers(args.num_of_passengers)
+    if args.save_instance:
+        instance_file.save_instances(args.save_instance, [(passengers, taxi_start_position)])
 
     if args.demo:
+        from local_search_from_RANDOM_demo import demo_local_search_with_random_as_baseline
         demo_local_search_with_random_as_baseline(passengers)
         return
 
+    distances = DistanceMatrix(passengers, taxi_start_position, get_provider(args.distance, args.road_network))
+
     if args.num_of_passengers < 7:
-        sol_greedy = GREEDY(passengers, (0, 0)).solve()
-        greedy_dist = utils.get_solution_len(sol_greedy)
-        alg = BRUTE_FORCE(passengers, (0, 0), greedy_dist + EPSILON)
-        alg.solve([((0, 0), 0)])
-        s = alg.best_solution
-        print(s)
-        plot_solution(s)
+        s = run_solver(DYNAMIC_PROGRAMMING(passengers, taxi_start_position, distances), args)
+        output_solution(s, args, distances)
         return
 
     if args.algorithm == 'Genetic':
         funcs = GeneticFuncsInterface(gf_keep_sorted.crossover_keep_sorted, gf_keep_sorted.mutation_keep_sorted)
-        alg = GENETIC(passengers, (0, 0), funcs)
-        s, _ = alg.solve()
+        alg = GENETIC(passengers, taxi_start_position, funcs, distances)
+        s, _ = run_solver(alg, args)
+    elif args.algorithm == 'IslandGenetic':
+        funcs = GeneticFuncsInterface(gf_keep_sorted.crossover_keep_sorted, gf_keep_sorted.mutation_keep_sorted)
+        alg = ISLAND_GENETIC(passengers, taxi_start_position, funcs, num_of_islands=args.islands,
+                             processes=args.processes, distances=distances)
+        s, _ = run_solver(alg, args)
+    elif args.algorithm == 'VectorizedGenetic':
+        alg = VECTORIZED_GENETIC(passengers, taxi_start_position, distances=distances)
+        s, _ = run_solver(alg, args)
     elif args.algorithm == 'LocalSearch':
-        sol_greedy = GREEDY(passengers, (0, 0)).solve()
-        alg = LOCAL_SEARCH(passengers, (0, 0), sol_greedy)
-        s, _ = alg.solve()
+        sol_greedy = GREEDY(passengers, taxi_start_position, distances).solve()
+        alg = LOCAL_SEARCH(passengers, taxi_start_position, sol_greedy, distances, or_opt=args.or_opt,
+                           k_nearest=args.k_nearest)
+        s, _ = run_solver(alg, args)
     elif args.algorithm == 'BruteForce':
-        sol_greedy = GREEDY(passengers, (0, 0)).solve()
-        greedy_dist = utils.get_solution_len(sol_greedy)
-        alg = BRUTE_FORCE(passengers, (0, 0), greedy_dist + EPSILON)
-        alg.solve([((0, 0), 0)])
+        sol_greedy = GREEDY(passengers, taxi_start_position, distances).solve()
+        greedy_dist = utils.get_solution_len(sol_greedy, distances)
+        alg = BRUTE_FORCE(passengers, taxi_start_position, greedy_dist + EPSILON, distances=distances)
+        run_solver(alg, args, [(taxi_start_position, 0)])
         s = alg.best_solution
+        print(alg.stats)
+    elif args.algorithm == 'Cluster':
+        alg = CLUSTER(passengers, taxi_start_position, processes=args.processes, distances=distances)
+        s = run_solver(alg, args)
+    elif args.algorithm == 'DynamicProgramming':
+        s = run_solver(DYNAMIC_PROGRAMMING(passengers, taxi_start_position, distances), args)
     else:
-        sol_greedy = GREEDY(passengers, (0, 0)).solve()
+        sol_greedy = GREEDY(passengers, taxi_start_position, distances).solve()
         if args.algorithm == 'Greedy':
-            alg = GREEDY(passengers, (0, 0))
+            alg = GREEDY(passengers, taxi_start_position, distances)
         elif args.algorithm == 'HillClimbing':
-            alg = HILL_CLIMBING(passengers, (0, 0), sol_greedy)
+            alg = HILL_CLIMBING(passengers, taxi_start_position, sol_greedy, distances, or_opt=args.or_opt,
+                                k_nearest=args.k_nearest)
         elif args.algorithm == 'SimulatedAnnealing':
-            alg = SIMULATED_ANNEALING(passengers, (0, 0), sol_greedy)
+            alg = SIMULATED_ANNEALING(passengers, taxi_start_position, sol_greedy, distances, or_opt=args.or_opt)
         elif args.algorithm == 'BeamLocalSearch':
-            alg = BEAM(passengers, (0, 0), sol_greedy)
+            alg = BEAM(passengers, taxi_start_position, sol_greedy, distances)
         elif args.algorithm == 'Multiple':
-            sol_random = RANDOM(passengers, (0, 0)).solve()
-            alg = MULTIPLE(passengers, (0, 0), sol_random, 100)
+            sol_random = RANDOM(passengers, taxi_start_position, distances=distances).solve()
+            alg = MULTIPLE(passengers, taxi_start_position, sol_random, 100, distances, processes=args.processes,
+                           or_opt=args.or_opt)
+        elif args.algorithm == 'TabuSearch':
+            alg = TABU_SEARCH(passengers, taxi_start_position, sol_greedy, distances, or_opt=args.or_opt)
 
-        s = alg.solve()
+        s = run_solver(alg, args)
 
-    print(s)
-    plot_solution(s)
+    output_solution(s, args, distances)
 
 
 if __name__ == "__main__":
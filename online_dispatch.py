@@ -0,0 +1,179 @@
+import random
+import time
+
+import numpy as np
+
+import utils
+from distance_providers import EuclideanDistance
+
+
+def _distances_to(provider, coordinates, point):
+    """the distances from point to every row of coordinates, as one row of the provider"""
+    return provider.pairwise(point[np.newaxis, :], coordinates)[0]
+
+
+def _insertion_costs(provider, coordinates, edges, point):
+    """
+    :param coordinates: array of shape (m, 2) of the stations of a route
+    :param edges: array of the m - 1 lengths of the edges between the stations of the route
+    :param point: the (x, y) of a station to insert
+    :return: array of m costs, the k-th is the added length if the station is inserted right after the k-th station
+    """
+    to_point = _distances_to(provider, coordinates, point)
+    costs = to_point.copy()
+    costs[:-1] += to_point[1:] - edges
+    return costs
+
+
+class OnlineDispatcher:
+    """
+    Keeps a live route of a taxi while passengers keep arriving. A new passenger is inserted at the cheapest legal
+    positions of its pick up and drop in O(n) vectorized work, without solving the route again. The first station of
+    the route is the current position of the taxi, and stations are removed from the route as the taxi visits them.
+    After every insertion the route can be polished by a local search that runs until a time budget is used.
+    The costs are measured with a distance provider, and the lengths of the edges of the route are kept up to date,
+    so an insertion only computes the distances from the new stations to the stations of the route.
+    """
+
+    def __init__(self, taxi_start_position, polish_time=0, provider=None):
+        """
+
+        :param taxi_start_position: the start position (coordinate) of the taxi driver
+        :param polish_time: seconds of local search after every insertion, 0 for no polish
+        :param provider: DistanceProvider of the costs, EuclideanDistance if None
+        """
+        self.route = [(taxi_start_position, 0)]  # the stations the taxi still has to visit, in the solution format
+        self.coordinates = np.array([taxi_start_position], dtype=float)
+        self.edges = np.zeros(0)  # edges[k] is the distance from the k-th station of the route to the next one
+        self.polish_time = polish_time
+        self.provider = provider if provider is not None else EuclideanDistance()
+
+    def __len__(self):
+        return len(self.route)
+
+    def __str__(self):
+        return 'Online Cheapest Insertion'
+
+    def length(self):
+        """the length of the rest of the route"""
+        return float(self.edges.sum())
+
+    def _insert(self, index, station):
+        point = np.asarray(station[0], dtype=float)
+        # the edge from the previous station is replaced by the edges from it and to the next station, if there is one
+        new_edges = _distances_to(self.provider, self.coordinates[index - 1:index + 1], point)
+        self.edges = np.concatenate((self.edges[:index - 1], new_edges, self.edges[index:]))
+        self.route.insert(index, station)
+        self.coordinates = np.insert(self.coordinates, index, point, axis=0)
+
+    def _without(self, index):
+        """the coordinates and the edges of the route without the station at index"""
+        coordinates = np.delete(self.coordinates, index, axis=0)
+        new_edge = _distances_to(self.provider, coordinates[index:index + 1], coordinates[index - 1])
+        return coordinates, np.concatenate((self.edges[:index - 1], new_edge, self.edges[index + 1:]))
+
+    def _pop(self, index):
+        self.coordinates, self.edges = self._without(index)
+        return self.route.pop(index)
+
+    def add_passenger(self, passenger):
+        """
+        inserts the pick up and the drop of a new passenger at the cheapest positions that keep the pick up before the
+        drop, then polishes the route if polish_time is set
+        :return: the added length of the insertion (before the polish)
+        """
+        pickup, drop = np.asarray(passenger.start, dtype=float), np.asarray(passenger.end, dtype=float)
+        to_pickup = _distances_to(self.provider, self.coordinates, pickup)
+        to_drop = _distances_to(self.provider, self.coordinates, drop)
+        pickup_costs, drop_costs = to_pickup.copy(), to_drop.copy()
+        pickup_costs[:-1] += to_pickup[1:] - self.edges
+        drop_costs[:-1] += to_drop[1:] - self.edges
+
+        # pick up and drop right after each other, after the k-th station
+        together = to_pickup + self.provider.distance(pickup, drop)
+        together[:-1] += to_drop[1:] - self.edges
+        # pick up after the k-th station and drop after a later one
+        apart = np.full(len(self.coordinates), np.inf)
+        apart[:-1] = pickup_costs[:-1] + np.minimum.accumulate(drop_costs[:0:-1])[::-1]
+
+        pickup_after, apart_after = int(together.argmin()), int(apart.argmin())
+        if apart[apart_after] < together[pickup_after] - utils.EPSILON:
+            pickup_after = apart_after
+            drop_after = pickup_after + 1 + int(drop_costs[pickup_after + 1:].argmin())
+            added_length = float(apart[apart_after])
+        else:
+            drop_after = pickup_after
+            added_length = float(together[pickup_after])
+
+        self._insert(drop_after + 1, (passenger.end, passenger.passenger_id, True))
+        self._insert(pickup_after + 1, (passenger.start, passenger.passenger_id, False))
+        if self.polish_time:
+            self.polish(self.polish_time)
+        return added_length
+
+    def advance(self):
+        """
+        moves the taxi to the next station of the route and removes it from the route
+        :return: the visited station, or None if the route is done
+        """
+        if len(self.route) == 1:
+            return None
+        station = self.route.pop(1)
+        self.route[0] = (station[0], 0)
+        self.coordinates = self.coordinates[1:]  # the taxi is at the visited station
+        self.edges = self.edges[1:]
+        return station
+
+    def _partner_index(self, index):
+        """the index of the other station of the same passenger, or None if the passenger was already picked up"""
+        _, passenger_id, is_destination = self.route[index]
+        others = range(index - 1, 0, -1) if is_destination else range(index + 1, len(self.route))
+        for other in others:
+            if self.route[other][1] == passenger_id:
+                return other
+        return None
+
+    def _relocate(self, index):
+        """
+        moves the station at index to the cheapest legal position of the route without it, if that shortens the route
+        :return: True if the station moved
+        """
+        station = self.route[index]
+        partner = self._partner_index(index)
+        point = self.coordinates[index]
+        coordinates, edges = self._without(index)
+        removal_gain = float(self.edges[index - 1:index + 1].sum() - edges[index - 1:index].sum())
+        costs = _insertion_costs(self.provider, coordinates, edges, point)
+        if partner is None:
+            first, last = 0, len(costs)
+        elif station[2]:  # a drop goes after its pick up
+            first, last = partner, len(costs)
+        else:  # a pick up goes before its drop, which moved one back in the route without the station
+            first, last = 0, partner - 1
+        after = first + int(costs[first:last].argmin())
+        if costs[after] >= removal_gain - utils.EPSILON:
+            return False
+        self._pop(index)
+        self._insert(after + 1, station)
+        return True
+
+    def polish(self, time_budget):
+        """
+        relocates stations of the route to their cheapest legal positions, in random order, until a pass over all
+        the stations finds no improvement or the time budget is used
+        :param time_budget: seconds
+        :return: the number of stations that moved
+        """
+        deadline = time.perf_counter() + time_budget
+        num_of_moves, improved = 0, True
+        while improved:
+            improved = False
+            indices = list(range(1, len(self.route)))
+            random.shuffle(indices)
+            for index in indices:
+                if time.perf_counter() >= deadline:
+                    return num_of_moves
+                if self._relocate(index):
+                    num_of_moves += 1
+                    improved = True
+        return num_of_moves
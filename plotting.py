@@ -0,0 +1,41 @@
+import matplotlib.pyplot as plt
+import utils
+
+
+def plot_solution(solution):
+    """plots the given solution. Pick up stations in blue, drop stations in red"""
+    fig = plt.figure()
+    ax = fig.add_subplot(111)
+
+    x, y, z = [p[0][0] for p in solution], [p[0][1] for p in solution], [p[1] for p in solution]
+    ax.plot(x, y, 'b-')
+
+    for i in range(len(x)):
+        ax.annotate(str(z[i]), (x[i], y[i]), textcoords="offset points", xytext=(0, 10), ha='center')
+
+    x_u, y_u = [p[0][0] for p in solution[1:] if not p[2]], [p[0][1] for p in solution[1:] if not p[2]]
+    x_d, y_d = [p[0][0] for p in solution[1:] if p[2]], [p[0][1] for p in solution[1:] if p[2]]
+    ax.plot(x_u, y_u, 'bo')
+    ax.plot(x_d, y_d, 'rs')
+
+    cur_dist = utils.get_solution_len(solution)
+    ax.set_title("Solution Length: " + str(round(cur_dist, 2)))
+    plt.show()
+
+
+def plot_multiple_solutions(num_rows, num_cols, solutions, algs):
+    """plot solutions of several algorithms in num_rows*num_cols subplots"""
+
+    fig, axs = plt.subplots(num_rows, num_cols, figsize=(15, 6), facecolor='w', edgecolor='k')
+    fig.subplots_adjust(hspace=.5, wspace=.001)
+
+    for i in range(num_rows):
+        for j in range(num_cols):
+            x, y, z, s = utils.set_data_for_solution(solutions[num_cols * i + j])
+            axs[i, j].plot(x, y)
+
+            axs[i, j].set_title(str(algs[num_cols * i + j]) + ": " + str(s))
+            for k in range(len(x)):
+                axs[i, j].annotate(str(z[k]), (x[k], y[k]),
+                                   textcoords="offset points", xytext=(0, 5), ha='center')
+    plt.show()
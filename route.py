@@ -0,0 +1,77 @@
+from array import array
+
+NOT_IN_ROUTE = -1
+
+
+class Route:
+    """
+    A compact solution of the Taxi Problem: the station ids (see DistanceMatrix) in an int array, together with the
+    position of every station in the route, so finding the stations of a passenger takes constant time
+    """
+
+    def __init__(self, station_ids):
+        """
+
+        :param station_ids: the ids of the stations by the order they are visited, starting with the start station
+        """
+        self.stations = array('i', station_ids)
+        self.positions = array('i', [NOT_IN_ROUTE]) * (max(self.stations, default=-1) + 1)
+        for position, station_id in enumerate(self.stations):
+            self.positions[station_id] = position
+
+    @classmethod
+    def from_solution(cls, solution, distances):
+        """builds a route from a solution (list of [((x, y), passenger_id, is_destination), .. ])"""
+        return cls(distances.solution_to_ids(solution))
+
+    def to_solution(self, distances):
+        """converts the route back to a solution (list of [((x, y), passenger_id, is_destination), .. ])"""
+        return distances.ids_to_solution(self.stations)
+
+    def __len__(self):
+        return len(self.stations)
+
+    def __getitem__(self, position):
+        return self.stations[position]
+
+    def __iter__(self):
+        return iter(self.stations)
+
+    def __eq__(self, other):
+        return isinstance(other, Route) and self.stations == other.stations
+
+    def __repr__(self):
+        return 'Route(' + str(self.stations.tolist()) + ')'
+
+    def index(self, station_id):
+        """the position of the station in the route"""
+        position = self.positions[station_id] if station_id < len(self.positions) else NOT_IN_ROUTE
+        if position == NOT_IN_ROUTE:
+            raise ValueError(str(station_id) + ' is not in route')
+        return position
+
+    def copy(self):
+        route = Route.__new__(Route)
+        route.stations = array('i', self.stations)
+        route.positions = array('i', self.positions)
+        return route
+
+    def move(self, station_index, target_index):
+        """moves the station at station_index to target_index, only the positions between them change"""
+        station_id = self.stations.pop(station_index)
+        self.stations.insert(target_index, station_id)
+        for position in range(min(station_index, target_index), max(station_index, target_index) + 1):
+            self.positions[self.stations[position]] = position
+
+    def move_segment(self, start_index, length, target_index, reverse=False):
+        """
+        moves the 'length' stations from start_index to target_index (of the route without them), reversed if reverse
+        is set. Only the positions between the old and the new place of the segment change
+        """
+        segment = self.stations[start_index:start_index + length]
+        if reverse:
+            segment.reverse()
+        del self.stations[start_index:start_index + length]
+        self.stations[target_index:target_index] = segment
+        for position in range(min(start_index, target_index), max(start_index, target_index) + length):
+            self.positions[self.stations[position]] = position
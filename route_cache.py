@@ -0,0 +1,99 @@
+import collections
+
+import numpy as np
+
+DEFAULT_MAX_SIZE = 2 ** 16  # number of routes the cache keeps
+ZOBRIST_SEED = 2021  # the keys are the same in every process, so fingerprints can be compared between processes
+
+
+class RouteCostCache:
+    """
+    Memoizes the lengths of whole routes, for the solvers that score the same routes again and again (the survivors of
+    every generation of the genetic algorithm, the local optima that several restarts reach).
+    A route is keyed by a Zobrist style fingerprint of its station order: the XOR over the positions of a random key of
+    the station times a random key of the position. A move only changes the terms of the positions between its
+    source and its target, so the fingerprint of a neighbor is updated in time of that range (see move_fingerprint).
+    Two different routes get the same 64 bit fingerprint with a negligible probability, which is not checked.
+    The cache keeps the max_size most recently used routes, and counts its hits and misses. Only the misses are scored
+    with the distance matrix, so only they count as evaluations.
+    """
+
+    def __init__(self, distances, max_size=DEFAULT_MAX_SIZE):
+        """
+
+        :param distances: DistanceMatrix of the instance
+        :param max_size: the maximal number of routes in the cache
+        """
+        self.distances = distances
+        self.max_size = max_size
+        rng = np.random.default_rng(ZOBRIST_SEED)
+        self._station_keys = rng.integers(0, 2 ** 63, len(distances), dtype=np.uint64)
+        self._position_keys = rng.integers(0, 2 ** 63, len(distances), dtype=np.uint64) | np.uint64(1)
+        self._lengths = collections.OrderedDict()  # fingerprint: length, the least recently used first
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def _terms(self, station_ids, first_position):
+        """the XOR of the fingerprint terms of the given stations, the first of them at first_position"""
+        station_ids = np.asarray(station_ids)
+        positions = self._position_keys[first_position:first_position + len(station_ids)]
+        return int(np.bitwise_xor.reduce(self._station_keys[station_ids] * positions))
+
+    @staticmethod
+    def _ids(station_ids):
+        """the station ids of a Route or a list as an array, without copying the array of a Route"""
+        if hasattr(station_ids, 'stations'):
+            return np.frombuffer(station_ids.stations, dtype=np.int32)
+        return np.asarray(station_ids, dtype=np.intp)
+
+    def fingerprint(self, station_ids):
+        """
+        :param station_ids: a Route or a list of station ids
+        :return: the fingerprint of the route, an int
+        """
+        return self._terms(self._ids(station_ids), 0)
+
+    def move_fingerprint(self, fingerprint, route, move):
+        """
+        :param fingerprint: the fingerprint of the route
+        :param route: a Route, it is not changed
+        :param move: a legal move (station_index, target_index) or segment move (start_index, length, target_index,
+        reverse)
+        :return: the fingerprint of the route after the move, without copying the route
+        """
+        if len(move) == 4:
+            start_index, length, target_index, reverse = move
+        else:
+            (start_index, target_index), length, reverse = move, 1, False
+        first = min(start_index, target_index)
+        old = route.stations[first:max(start_index, target_index) + length].tolist()
+        segment = old[start_index - first:start_index - first + length]
+        new = old[:start_index - first] + old[start_index - first + length:]
+        new[target_index - first:target_index - first] = segment[::-1] if reverse else segment
+        return fingerprint ^ self._terms(old, first) ^ self._terms(new, first)
+
+    def route_len(self, station_ids):
+        """
+        the length of the route, from the cache if it was scored lately
+        :param station_ids: a Route or a list of station ids
+        """
+        station_ids = self._ids(station_ids)
+        key = self._terms(station_ids, 0)
+        length = self._lengths.get(key)
+        if length is not None:
+            self.hits += 1
+            self._lengths.move_to_end(key)
+            return length
+        self.misses += 1
+        length = self.distances.get_ids_len(station_ids)
+        self._lengths[key] = length
+        if len(self._lengths) > self.max_size:
+            self._lengths.popitem(last=False)
+        return length
+
+    def solution_len(self, solution):
+        """the length of the given solution (list of stations), from the cache if it was scored lately"""
+        return self.route_len(self.distances.solution_to_ids(solution))
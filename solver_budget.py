@@ -0,0 +1,69 @@
+import time
+
+
+class SolverBudget:
+    """
+    A limit on the work of a solver: a time limit in seconds and/or a maximal number of evaluations (routes and moves
+    scored with the distance matrix, see DistanceMatrix.num_of_evaluations).
+    Attach it with solver.budget = SolverBudget(...) before calling solve. The solver checks exhausted() in its main
+    loop and returns the best solution it has found when the budget runs out. The budget starts when the outermost
+    solve starts, so solvers that run other solvers (restarts, islands) share it. Solvers that run tasks in worker
+    processes give every task its own budget (see for_task) and add the evaluations the task used to their distance
+    matrix, so the limit does not depend on how the worker processes are started.
+    """
+
+    def __init__(self, time_limit=None, max_evaluations=None):
+        """
+
+        :param time_limit: seconds from the start of solve, None for no limit
+        :param max_evaluations: number of evaluations from the start of solve, None for no limit
+        """
+        self.time_limit = time_limit
+        self.max_evaluations = max_evaluations
+        self.running = False
+        self.deadline = None
+        self._distances = None
+        self._last_evaluation = None
+
+    def start(self, solver):
+        """called when the solver starts to solve"""
+        self.running = True
+        if self.time_limit is not None:
+            self.deadline = time.perf_counter() + self.time_limit
+        self._distances = getattr(solver, 'distances', None)
+        self._last_evaluation = None
+        if self.max_evaluations is not None and self._distances is not None:
+            self._last_evaluation = self._distances.num_of_evaluations + self.max_evaluations
+
+    def finish(self):
+        """called when the outermost solver returns"""
+        self.running = False
+
+    def remaining_evaluations(self):
+        """the number of evaluations that are left, None if there is no limit on the evaluations"""
+        if self._last_evaluation is None:
+            return None
+        return max(self._last_evaluation - self._distances.num_of_evaluations, 0)
+
+    def exhausted(self):
+        """True if the time or the evaluations ran out"""
+        if self._last_evaluation is not None and self._distances.num_of_evaluations >= self._last_evaluation:
+            return True
+        return self.deadline is not None and time.perf_counter() >= self.deadline
+
+    def for_task(self, max_evaluations=None):
+        """
+        a budget for a task that runs in a worker process: it ends at the deadline of this budget and allows at most
+        max_evaluations evaluations, counted by the distance matrix of the worker from the start of the task
+        :param max_evaluations: the evaluations of the task, all the remaining evaluations if None
+        """
+        task_budget = SolverBudget(max_evaluations=max_evaluations if max_evaluations is not None
+                                   else self.remaining_evaluations())
+        task_budget.deadline = self.deadline
+        return task_budget
+
+    def __getstate__(self):
+        # a task budget is sent to a worker process before it starts, without the distance matrix of the last solve
+        state = dict(self.__dict__)
+        state['_distances'], state['_last_evaluation'] = None, None
+        return state
@@ -0,0 +1,99 @@
+import contextlib
+import functools
+import time
+
+
+class SolverObserver:
+    """
+    Collects what a solver does while it runs: named counters (evaluations, neighbors, accepted moves, generations..),
+    the time spent in every phase and the trajectory of the best length so far.
+    Attach it with solver.observer = SolverObserver() before calling solve. Solvers only call the observer if one is
+    attached, so a solver without an observer pays a single 'is None' check at each hook. Subclass it to react to the
+    events in a different way.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.phase_times = {}
+        self.trajectory = []  # (seconds since start, best length so far)
+        self.best_length = None
+        self._start_time = time.perf_counter()
+        self._start_evaluations = 0
+        self._start_cache = (0, 0)
+
+    def start(self, solver):
+        """called when the solver starts to solve"""
+        self._start_time = time.perf_counter()
+        distances = getattr(solver, 'distances', None)
+        self._start_evaluations = distances.num_of_evaluations if distances is not None else 0
+        costs = getattr(distances, 'costs', None)
+        self._start_cache = (costs.hits, costs.misses) if costs is not None else (0, 0)
+
+    def finish(self, solver):
+        """
+        called when the solver returns, adds the number of evaluations done with the distance matrix and the hits and
+        misses of its route cache
+        """
+        distances = getattr(solver, 'distances', None)
+        if distances is not None:
+            self.count('evaluations', distances.num_of_evaluations - self._start_evaluations)
+        costs = getattr(distances, 'costs', None)
+        if costs is not None:
+            self.count('cache_hits', costs.hits - self._start_cache[0])
+            self.count('cache_misses', costs.misses - self._start_cache[1])
+        self.phase_times['total'] = self.phase_times.get('total', 0) + time.perf_counter() - self._start_time
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def best(self, length):
+        """called with the length of a new solution, keeps it if it is the best so far"""
+        if self.best_length is None or length < self.best_length:
+            self.best_length = length
+            self.trajectory.append((time.perf_counter() - self._start_time, length))
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """measures the time of the code inside the 'with' block"""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phase_times[name] = self.phase_times.get(name, 0) + time.perf_counter() - start_time
+
+    def summary(self):
+        """the counters, the phase times and the trajectory as a dictionary"""
+        return {'counters': dict(self.counters), 'phase_times': dict(self.phase_times),
+                'best_length': self.best_length, 'trajectory': list(self.trajectory)}
+
+
+def observe_phase(observer, name):
+    """observer.phase(name), or a context that does nothing if there is no observer"""
+    if observer is None:
+        return contextlib.nullcontext()
+    return observer.phase(name)
+
+
+def observed(solve):
+    """
+    decorator of the solve methods: calls start and finish of the solver's observer around solve, if it has one, and
+    starts the solver's budget (see SolverBudget) unless an outer solve already started it
+    """
+    @functools.wraps(solve)
+    def wrapper(self, *args, **kwargs):
+        observer, budget = self.observer, getattr(self, 'budget', None)
+        if observer is None and budget is None:
+            return solve(self, *args, **kwargs)
+        starts_budget = budget is not None and not budget.running
+        if starts_budget:
+            budget.start(self)
+        if observer is not None:
+            observer.start(self)
+        try:
+            return solve(self, *args, **kwargs)
+        finally:
+            if observer is not None:
+                observer.finish(self)
+            if starts_budget:
+                budget.finish()
+    return wrapper
@@ -0,0 +1,81 @@
+import math
+
+
+class GridIndex:
+    """
+    A dynamic spatial index of stations on a uniform grid. Stations can be inserted and removed at any time, and the
+    nearest station to a point is found by scanning the grid cells in growing rings around the point.
+    """
+
+    def __init__(self, coordinates, expected_size=None):
+        """
+
+        :param coordinates: list of (x, y) of all the stations that may be inserted, by station id
+        :param expected_size: the typical number of stations in the index, sets the size of the cells (about 2
+        stations per cell)
+        """
+        self.coordinates = coordinates
+        xs, ys = [c[0] for c in coordinates], [c[1] for c in coordinates]
+        self.min_x, self.min_y = min(xs), min(ys)
+        width, height = max(xs) - self.min_x, max(ys) - self.min_y
+        num_of_cells = max(1, (expected_size or len(coordinates)) // 2)
+        self.cell_size = max(math.sqrt(width * height / num_of_cells), max(width, height) / num_of_cells, 1)
+        self.num_of_cols = int(width // self.cell_size) + 1
+        self.num_of_rows = int(height // self.cell_size) + 1
+        self.cells = [set() for _ in range(self.num_of_cols * self.num_of_rows)]
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _cell(self, x, y):
+        """the column and the row of the cell that holds the point"""
+        col = min(max(int((x - self.min_x) // self.cell_size), 0), self.num_of_cols - 1)
+        row = min(max(int((y - self.min_y) // self.cell_size), 0), self.num_of_rows - 1)
+        return col, row
+
+    def insert(self, station_id):
+        col, row = self._cell(*self.coordinates[station_id])
+        self.cells[row * self.num_of_cols + col].add(station_id)
+        self.size += 1
+
+    def remove(self, station_id):
+        col, row = self._cell(*self.coordinates[station_id])
+        self.cells[row * self.num_of_cols + col].remove(station_id)
+        self.size -= 1
+
+    def nearest(self, x, y):
+        """
+        :return: the id of the nearest station to (x, y) in the index, the smallest id among stations at the same
+        distance, or None if the index is empty
+        """
+        if not self.size:
+            return None
+        col, row = self._cell(x, y)
+        best_id, best_dist = None, math.inf
+        max_ring = max(col, row, self.num_of_cols - 1 - col, self.num_of_rows - 1 - row)
+        for ring in range(max_ring + 1):
+            # every station in this ring or farther is at least (ring - 1) cells away from the point
+            if best_id is not None and best_dist < ((ring - 1) * self.cell_size) ** 2:
+                break
+            for cell_col, cell_row in self._ring_cells(col, row, ring):
+                for station_id in self.cells[cell_row * self.num_of_cols + cell_col]:
+                    sx, sy = self.coordinates[station_id]
+                    dist = (sx - x) ** 2 + (sy - y) ** 2
+                    if dist < best_dist or (dist == best_dist and station_id < best_id):
+                        best_id, best_dist = station_id, dist
+        return best_id
+
+    def _ring_cells(self, col, row, ring):
+        """the cells of the grid at Chebyshev distance 'ring' from the cell (col, row)"""
+        if ring == 0:
+            yield col, row
+            return
+        for c in range(max(col - ring, 0), min(col + ring, self.num_of_cols - 1) + 1):
+            for r in (row - ring, row + ring):
+                if 0 <= r < self.num_of_rows:
+                    yield c, r
+        for r in range(max(row - ring + 1, 0), min(row + ring - 1, self.num_of_rows - 1) + 1):
+            for c in (col - ring, col + ring):
+                if 0 <= c < self.num_of_cols:
+                    yield c, r
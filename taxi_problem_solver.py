@@ -1,23 +1,82 @@
+import collections
+import heapq
 import math
+import multiprocessing
 import random
+import time
 import utils
 import itertools
+import numpy as np
+from distance_matrix import DistanceMatrix, START_STATION
+from route import Route
+from solver_observer import observed, observe_phase
+from spatial_index import GridIndex
+
+OR_OPT_PROBABILITY = 0.5  # the share of segment moves among the random moves of the solvers with or_opt
+MIN_RESTART_EVALUATIONS = 2  # a restart scores its first route and its solution
 
 
 class TaxiProblemSolver:
     """
     General class that initializes the required parameters to solve the Taxi Problem
     """
-    def __init__(self, list_of_passengers, taxi_start_position, initial_solution=None):
+    observer = None  # a SolverObserver that collects counters while solving
+    budget = None  # a SolverBudget that limits the work of solve
+
+    def __init__(self, list_of_passengers, taxi_start_position, initial_solution=None, distances=None, or_opt=False,
+                 k_nearest=None):
         """
 
         :param list_of_passengers: list of passengers to try find a good rout between
         :param taxi_start_position: the start position (coordinate) of the taxi driver
         :param initial_solution: a solution to the problem
+        :param distances: DistanceMatrix of the instance, built from the passengers if not given
+        :param or_opt: if True, the local search solvers also move segments of 2-3 stations (see
+        utils.get_legal_segment_moves), not only single stations
+        :param k_nearest: if given, LocalSearch and HillClimbing only move a station next to one of its k_nearest
+        nearest stations, and skip the stations whose neighborhood did not change since no move of them improved
+        (don't look bits). The segment moves of or_opt are not pruned
         """
         self.list_of_passengers = list_of_passengers
         self.taxi_start_position = taxi_start_position
         self.initial_solution = initial_solution
+        self.distances = distances if distances is not None else DistanceMatrix(list_of_passengers,
+                                                                                taxi_start_position)
+        self.or_opt = or_opt
+        self.k_nearest = k_nearest
+
+    def nearest_stations(self):
+        """the k_nearest nearest stations of every station, or None if k_nearest is not set"""
+        return self.distances.nearest_stations(self.k_nearest) if self.k_nearest is not None else None
+
+    @staticmethod
+    def wake_stations(active, route, move):
+        """
+        turns on the don't look bits of the stations whose neighborhood the move changes: the stations at the ends of
+        the edges it removes and adds, and their partners. Call before the move is applied
+        :param active: set of the ids of the stations that are looked at
+        """
+        removed, added = utils.get_move_edges(route, move)
+        for edge in removed + added:
+            for station in edge:
+                if station != START_STATION:
+                    active.add(station)
+                    active.add(utils.get_partner_station(station))
+
+    def get_legal_moves(self, route):
+        """all the legal moves of the route, with the segment moves if or_opt is set"""
+        moves = utils.get_legal_moves(route)
+        if self.or_opt:
+            moves += utils.get_legal_segment_moves(route)
+        return moves
+
+    def sample_legal_move(self, route):
+        """a random legal move of the route, a segment move with probability OR_OPT_PROBABILITY if or_opt is set"""
+        if self.or_opt and random.random() < OR_OPT_PROBABILITY:
+            move = utils.sample_legal_segment_move(route)
+            if move is not None:
+                return move
+        return utils.sample_legal_move(route)
 
 
 class LocalSearchTaxiProblemSolver(TaxiProblemSolver):
@@ -28,26 +87,88 @@ class LocalSearchTaxiProblemSolver(TaxiProblemSolver):
     further improvements.
     """
 
+    def __init__(self, list_of_passengers, taxi_start_position, initial_solution=None, distances=None,
+                 lazy_moves=False, or_opt=False, k_nearest=None, record_steps=False):
+        """
+
+        :param lazy_moves: if True, the moves are shuffled lazily instead of listing all the moves of every solution
+        :param record_steps: if True, solve also returns the solution and length after every accepted move (for the
+        demos), otherwise the list of steps is empty
+        """
+        super().__init__(list_of_passengers, taxi_start_position, initial_solution, distances, or_opt, k_nearest)
+        self.lazy_moves = lazy_moves
+        self.record_steps = record_steps
+
     def __str__(self):
         return 'Local Search'
 
+    def iter_random_moves(self, route, nearest=None, active=None):
+        """
+        yields the legal moves of the route in a random order. With or_opt the segment moves come in a random order
+        after all the single station moves, so they are only listed when the cheaper moves did not improve
+        :param nearest: if given, the candidate lists of the stations (see utils.get_station_moves). Then the stations
+        in active are visited in a random order with their candidate moves in a random order, and a station whose
+        moves were all yielded is removed from active (its don't look bit is set)
+        :param active: set of the ids of the stations that are looked at, required with nearest
+        """
+        if nearest is not None:
+            stations = list(active)
+            random.shuffle(stations)
+            for station in stations:
+                yield from self._iter_shuffled(utils.get_station_moves(route, route.index(station), nearest))
+                active.discard(station)
+        elif self.lazy_moves:
+            yield from utils.iter_shuffled_legal_moves(route)
+        else:
+            yield from self._iter_shuffled(utils.get_legal_moves(route))
+        if self.or_opt:
+            yield from self._iter_shuffled(utils.get_legal_segment_moves(route))
+
+    @staticmethod
+    def _iter_shuffled(moves):
+        while moves:
+            ind = random.randint(0, len(moves) - 1)
+            move = moves[ind]
+            moves[ind] = moves[-1]
+            moves.pop()
+            yield move
+
+    @observed
     def solve(self):
+        observer, budget = self.observer, self.budget
         steps_for_demo = []
-        solution = self.initial_solution  # list of [((x, y), passenger_id, is_destination), .. ]
-        cur_dist = utils.get_solution_len(solution)
-        steps_for_demo.append((solution, cur_dist))
-        set_of_neighbors = utils.get_set_of_neighbors(solution)
-        while len(set_of_neighbors) > 0:
-            ind = random.randint(0, len(set_of_neighbors) - 1)
-            cur_solution = set_of_neighbors[ind]
-            del set_of_neighbors[ind]
-            new_dist = utils.get_solution_len(cur_solution)
-            if new_dist < cur_dist:
-                cur_dist = new_dist
-                solution = cur_solution
-                steps_for_demo.append((solution, cur_dist))
-                set_of_neighbors = utils.get_set_of_neighbors(solution)
-        return solution, steps_for_demo
+        route = Route.from_solution(self.initial_solution, self.distances)
+        cur_dist = self.distances.costs.route_len(route)
+        if observer is not None:
+            observer.best(cur_dist)
+        if self.record_steps:
+            steps_for_demo.append((route.to_solution(self.distances), cur_dist))
+        nearest = self.nearest_stations()
+        active = set(route[1:]) if nearest is not None else None
+        num_of_neighbors = 0
+        found_improvement = True
+        while found_improvement:
+            found_improvement = False
+            for move in self.iter_random_moves(route, nearest, active):
+                if budget is not None and budget.exhausted():
+                    break
+                num_of_neighbors += 1
+                delta = utils.get_move_delta(route, move, self.distances)
+                if delta < -utils.EPSILON:
+                    if active is not None:
+                        self.wake_stations(active, route, move)
+                    utils.apply_move(route, move)
+                    cur_dist += delta
+                    if self.record_steps:
+                        steps_for_demo.append((route.to_solution(self.distances), cur_dist))
+                    if observer is not None:
+                        observer.count('moves_accepted')
+                        observer.best(cur_dist)
+                    found_improvement = True
+                    break
+        if observer is not None:
+            observer.count('neighbors', num_of_neighbors)
+        return route.to_solution(self.distances), steps_for_demo
 
 
 class HillClimbingTaxiProblemSolver(TaxiProblemSolver):
@@ -61,25 +182,52 @@ class HillClimbingTaxiProblemSolver(TaxiProblemSolver):
     def __str__(self):
         return 'Hill Climbing'
 
+    @observed
     def solve(self):
-        cur_solution = self.initial_solution  # list of [((x, y), passenger_id, is_destination), .. ]
-        cur_dist = utils.get_solution_len(cur_solution)
-        set_of_neighbors = utils.get_set_of_neighbors(cur_solution)
-        while len(set_of_neighbors) > 0:
-            min_dist = cur_dist
-            opt_solution = cur_solution
-            for new_solution in set_of_neighbors:
-                new_solution_dist = utils.get_solution_len(new_solution)
-                if new_solution_dist < min_dist:
-                    min_dist = new_solution_dist
-                    opt_solution = new_solution
-
-            if cur_dist <= min_dist:
+        observer, budget = self.observer, self.budget
+        route = Route.from_solution(self.initial_solution, self.distances)
+        cur_dist = self.distances.costs.route_len(route)
+        if observer is not None:
+            observer.best(cur_dist)
+        nearest = self.nearest_stations()
+        active = set(route[1:]) if nearest is not None else None
+        out_of_budget = False
+        while not out_of_budget:
+            opt_move, min_delta = None, -utils.EPSILON
+            if nearest is None:
+                moves = self.get_legal_moves(route)
+            else:  # the candidate moves of the stations that are looked at
+                moves = [move for station in active
+                         for move in utils.get_station_moves(route, route.index(station), nearest)]
+                if self.or_opt:
+                    moves += utils.get_legal_segment_moves(route)
+            improving = set()  # the stations that have an improving move
+            num_of_scored = 0
+            for move in moves:
+                if budget is not None and budget.exhausted():
+                    out_of_budget = True  # the best move of the moves that were scored is still an improvement
+                    break
+                delta = utils.get_move_delta(route, move, self.distances)
+                num_of_scored += 1
+                if delta < -utils.EPSILON:
+                    improving.add(route[move[0]])
+                if delta < min_delta:
+                    opt_move, min_delta = move, delta
+            if observer is not None:
+                observer.count('neighbors', num_of_scored)
+            if active is not None:
+                active &= improving  # a station without an improving move is skipped until its neighborhood changes
+
+            if opt_move is None:
                 break
-            cur_solution = opt_solution
-            cur_dist = min_dist
-            set_of_neighbors = utils.get_set_of_neighbors(cur_solution)
-        return cur_solution
+            if active is not None:
+                self.wake_stations(active, route, opt_move)
+            utils.apply_move(route, opt_move)
+            cur_dist += min_delta
+            if observer is not None:
+                observer.count('moves_accepted')
+                observer.best(cur_dist)
+        return route.to_solution(self.distances)
 
 
 class SimulatedAnnealingTaxiProblemSolver(TaxiProblemSolver):
@@ -93,97 +241,352 @@ class SimulatedAnnealingTaxiProblemSolver(TaxiProblemSolver):
     def __str__(self):
         return 'Simulated Annealing'
 
+    @observed
     def solve(self):
-        solution = self.initial_solution  # list of [((x, y), passenger_id, is_destination), .. ]
-        cur_dist = utils.get_solution_len(solution)
-        set_of_neighbors = utils.get_set_of_neighbors(solution)
+        """
+
+        :return: the shortest solution that was visited
+        """
+        observer, budget = self.observer, self.budget
+        route = Route.from_solution(self.initial_solution, self.distances)
+        cur_dist = self.distances.costs.route_len(route)
+        best_route, best_dist = route.copy(), cur_dist
+        if observer is not None:
+            observer.best(cur_dist)
         alpha = 1 / 25
         t = 100
         rate_of_cooling = 0.995
         while t > 0.1:
-            ind = random.randint(0, len(set_of_neighbors) - 1)
-            cur_solution = set_of_neighbors[ind]
-            new_dist = utils.get_solution_len(cur_solution)
+            if budget is not None and budget.exhausted():
+                break
+            move = self.sample_legal_move(route)
+            if move is None:
+                break
+            delta = utils.get_move_delta(route, move, self.distances)
 
-            delta = new_dist - cur_dist
             try:
                 prob = alpha * math.exp(-delta / t)
             except OverflowError:
                 prob = 1
             if delta < 0 or random.random() < prob:
-                cur_dist = new_dist
-                solution = cur_solution
-                set_of_neighbors = utils.get_set_of_neighbors(solution)
+                utils.apply_move(route, move)
+                cur_dist += delta
+                if cur_dist < best_dist - utils.EPSILON:
+                    best_route, best_dist = route.copy(), cur_dist
+                if observer is not None:
+                    observer.count('moves_accepted')
+                    observer.best(cur_dist)
 
             t *= rate_of_cooling
-        return solution
+            if observer is not None:
+                observer.count('neighbors')
+        return best_route.to_solution(self.distances)
+
+
+class TabuSearchTaxiProblemSolver(TaxiProblemSolver):
+    """
+    A local search that always makes the best move that is not tabu, even if it makes the solution longer, so it does
+    not stop at the first local optimum. The attributes of a move are the edges (station, next station) it removes, and
+    for the next 'tabu_tenure' iterations a move that adds one of them back is tabu. Edges are used rather than
+    positions, because every move shifts the positions of other stations and a different move could undo it.
+    The tabu edges are hashed in a dictionary with the iteration they expire at, so checking a move takes constant
+    time. A tabu move is still allowed if it leads to a solution shorter than the best so far (aspiration).
+    """
+
+    def __init__(self, list_of_passengers, taxi_start_position, initial_solution=None, distances=None, or_opt=False,
+                 tabu_tenure=None, max_iterations=1000, max_no_improvement=100, num_of_candidates=None):
+        """
+
+        :param tabu_tenure: number of iterations a removed edge stays tabu, by default a third of the number of stations
+        (at least 5)
+        :param max_iterations: the maximal number of moves
+        :param max_no_improvement: stop after this number of moves without a new best solution
+        :param num_of_candidates: the number of random legal moves scanned every iteration, None to scan all of them
+        """
+        super().__init__(list_of_passengers, taxi_start_position, initial_solution, distances, or_opt)
+        self.tabu_tenure = tabu_tenure if tabu_tenure is not None else max(5, (2 * len(list_of_passengers) + 1) // 3)
+        self.max_iterations = max_iterations
+        self.max_no_improvement = max_no_improvement
+        self.num_of_candidates = num_of_candidates
+
+    def __str__(self):
+        return 'Tabu Search'
+
+    def candidate_moves(self, route):
+        """the moves scanned in one iteration, all the legal moves or num_of_candidates random ones"""
+        if self.num_of_candidates is None:
+            return self.get_legal_moves(route)
+        moves = (self.sample_legal_move(route) for _ in range(self.num_of_candidates))
+        return [move for move in moves if move is not None]
+
+    @observed
+    def solve(self):
+        """
+
+        :return: the shortest solution that was visited
+        """
+        observer, budget = self.observer, self.budget
+        route = Route.from_solution(self.initial_solution, self.distances)
+        cur_dist = self.distances.costs.route_len(route)
+        best_route, best_dist = route.copy(), cur_dist
+        if observer is not None:
+            observer.best(cur_dist)
+        tabu_until = {}  # removed edge: the first iteration it may be added back
+        no_improvement, out_of_budget = 0, False
+        for iteration in range(self.max_iterations):
+            opt_move, min_delta = None, utils.MAX_INT
+            num_of_scored = 0
+            for move in self.candidate_moves(route):
+                if budget is not None and budget.exhausted():
+                    out_of_budget = True
+                    break
+                delta = utils.get_move_delta(route, move, self.distances)
+                num_of_scored += 1
+                if delta >= min_delta:
+                    continue
+                if cur_dist + delta >= best_dist - utils.EPSILON and \
+                        any(tabu_until.get(edge, 0) > iteration for edge in utils.get_move_edges(route, move)[1]):
+                    continue
+                opt_move, min_delta = move, delta
+            if observer is not None:
+                observer.count('neighbors', num_of_scored)
+            if opt_move is None or (out_of_budget and min_delta >= -utils.EPSILON):
+                break
+
+            for edge in utils.get_move_edges(route, opt_move)[0]:
+                tabu_until[edge] = iteration + 1 + self.tabu_tenure
+            utils.apply_move(route, opt_move)
+            cur_dist += min_delta
+            if observer is not None:
+                observer.count('moves_accepted')
+                observer.best(cur_dist)
+
+            if cur_dist < best_dist - utils.EPSILON:
+                best_route, best_dist = route.copy(), cur_dist
+                no_improvement = 0
+            else:
+                no_improvement += 1
+            if out_of_budget or no_improvement >= self.max_no_improvement:
+                break
+        return best_route.to_solution(self.distances)
 
 
 class BeamLocalSearchTaxiProblemSolver(LocalSearchTaxiProblemSolver):
     """
-    A version of the LocalSearch algorithm that holds a pool with a fixed size of solutions and add a solution instead
-    of another iff the new solution is better.
+    A version of the LocalSearch algorithm that holds a pool with a fixed size of different solutions and add a solution
+    instead of the worst one iff the new solution is better. The pool is a heap by length and every solution is kept in
+    it once (by the fingerprint of its route, see RouteCostCache, which is updated by the move so a route that is
+    already in the pool is never copied). Every solution draws its moves lazily, so the memory is NUM_OF_BEAM routes
+    and the state of their move iterators, which grows with the number of pairs each of them drew (see
+    utils.iter_shuffled_legal_moves).
     """
-    def __init__(self, list_of_passengers, taxi_start_position, initial_solution):
-        super().__init__(list_of_passengers, taxi_start_position, initial_solution)
-        self.NUM_OF_BEAM = 100
+    def __init__(self, list_of_passengers, taxi_start_position, initial_solution, distances=None, num_of_beam=100,
+                 max_moves_per_member=None):
+        """
+
+        :param num_of_beam: size of the pool
+        :param max_moves_per_member: the maximal number of moves a solution in the pool draws, None for all of them
+        """
+        super().__init__(list_of_passengers, taxi_start_position, initial_solution, distances)
+        self.NUM_OF_BEAM = num_of_beam
+        self.max_moves_per_member = max_moves_per_member
 
     def __str__(self):
         return 'Beam Local Search'
 
+    def member_moves(self, route):
+        """the lazy iterator over the moves of a solution in the pool"""
+        moves = utils.iter_shuffled_legal_moves(route)
+        if self.max_moves_per_member is not None:
+            moves = itertools.islice(moves, self.max_moves_per_member)
+        return moves
+
+    @observed
     def solve(self):
-        pool = []
-        initial_solution = self.initial_solution
-        for _ in range(self.NUM_OF_BEAM):
-            pool.append([initial_solution,
-                         utils.get_solution_len(initial_solution),
-                         utils.get_set_of_neighbors(initial_solution)])
-        found_improvement = True
-        while found_improvement:
-            found_improvement = False
-            worst_index = max([k for k in range(len(pool))], key=lambda j: pool[j][1])
-            worst_score = pool[worst_index][1]
-            for i in range(len(pool)):
-                solution, solution_score, solution_neighbors = pool[i]
-                if not solution_neighbors:
+        observer, budget, costs = self.observer, self.budget, self.distances.costs
+        counter = itertools.count()  # breaks ties in the heap
+        route = Route.from_solution(self.initial_solution, self.distances)
+        # a max heap by length of [-length, tie breaker, route, moves, fingerprint], moves is None if exhausted or
+        # removed
+        fingerprint = costs.fingerprint(route)
+        pool = [[-costs.route_len(route), next(counter), route, self.member_moves(route), fingerprint]]
+        if observer is not None:
+            observer.best(-pool[0][0])
+        in_pool = {fingerprint}
+        num_of_neighbors = 0
+        has_moves = True
+        while has_moves:
+            has_moves = False
+            for member in list(pool):
+                if budget is not None and budget.exhausted():
+                    has_moves = False
+                    break
+                neg_dist, _, solution, moves, fingerprint = member
+                if moves is None:
                     continue
-                ind = random.randint(0, len(solution_neighbors) - 1)
-                new_solution = solution_neighbors[ind]
-                del solution_neighbors[ind]
-                new_dist = utils.get_solution_len(new_solution)
-                if new_dist < worst_score:
-                    pool[worst_index] = [new_solution, new_dist, utils.get_set_of_neighbors(new_solution)]
-                    worst_index = max([k for k in range(len(pool))], key=lambda j: pool[j][1])
-                    worst_score = pool[worst_index][1]
-                    found_improvement = True
-        return max(pool, key=lambda j: j[1])[0]
+                move = next(moves, None)
+                if move is None:
+                    member[3] = None
+                    continue
+                has_moves = True
+                num_of_neighbors += 1
+                new_dist = utils.get_move_delta(solution, move, self.distances) - neg_dist
+                if new_dist >= -pool[0][0] - utils.EPSILON:
+                    continue
+                key = costs.move_fingerprint(fingerprint, solution, move)
+                if key in in_pool:
+                    continue
+                new_route = solution.copy()
+                utils.apply_move(new_route, move)
+
+                new_member = [-new_dist, next(counter), new_route, self.member_moves(new_route), key]
+                if len(pool) < self.NUM_OF_BEAM:
+                    heapq.heappush(pool, new_member)
+                else:
+                    worst = heapq.heapreplace(pool, new_member)
+                    worst[3] = None
+                    in_pool.discard(worst[4])
+                in_pool.add(key)
+                if observer is not None:
+                    observer.count('moves_accepted')
+                    observer.best(new_dist)
+        if observer is not None:
+            observer.count('neighbors', num_of_neighbors)
+        return max(pool)[2].to_solution(self.distances)
+
+
+_restart_solver = None  # the LocalSearchTaxiProblemSolver of a restart worker process
+
+
+def _init_restart_worker(list_of_passengers, taxi_start_position, initial_solution, distances, lazy_moves, or_opt):
+    """builds the local search of the worker process once, so only the seeds are sent to it"""
+    global _restart_solver
+    _restart_solver = LocalSearchTaxiProblemSolver(list_of_passengers, taxi_start_position, initial_solution,
+                                                   distances, lazy_moves, or_opt)
+
+
+def _run_restart(task):
+    """
+    runs one local search with its own seed
+    :param task: (seed, SolverBudget of the restart or None)
+    :return: the solution, its length and the number of evaluations the restart used
+    """
+    seed, budget = task
+    first_evaluation = _restart_solver.distances.num_of_evaluations
+    _restart_solver.budget = budget
+    with utils.seeded_random(seed):
+        solution = _restart_solver.solve()[0]
+    length = _restart_solver.distances.costs.solution_len(solution)
+    return solution, length, _restart_solver.distances.num_of_evaluations - first_evaluation
 
 
 class MultipleLocalSearchTaxiProblemSolver(LocalSearchTaxiProblemSolver):
     """
-    A version of the LocalSearch algorithm that runs LocalSearch a given number of times and takes the best result
+    A version of the LocalSearch algorithm that runs LocalSearch a given number of times and takes the best result.
+    Every try gets its own seed, drawn in advance, so the result is the same with any number of processes.
     """
 
-    def __init__(self, list_of_passengers, taxi_start_position, initial_solution, n_tries=35):
-        super().__init__(list_of_passengers, taxi_start_position, initial_solution)
+    def __init__(self, list_of_passengers, taxi_start_position, initial_solution, n_tries=35, distances=None,
+                 processes=1, target_dist=None, time_limit=None, or_opt=False):
+        """
+
+        :param n_tries: number of times to run LocalSearch
+        :param processes: number of worker processes that run the tries, the number of cpus if None
+        :param target_dist: stop as soon as a solution is not longer than this length
+        :param time_limit: stop starting new tries after this number of seconds
+        """
+        super().__init__(list_of_passengers, taxi_start_position, initial_solution, distances, or_opt=or_opt)
         self.n_tries = n_tries
+        self.processes = processes
+        self.target_dist = target_dist
+        self.time_limit = time_limit
+        self.best_distances = []  # the best length after every try
 
     def __str__(self):
         return 'Multiple Local Search'
 
+    @observed
     def solve(self, iteration_dict=None):
-        """ Finds the neighbor with the shortest route """
-        best_solution, best_solution_dist = None, 10 ** 6
-        for iter in range(self.n_tries):
-            cur_solution = super().solve()[0]
-            cur_dist = utils.get_solution_len(cur_solution)
-            if cur_dist < best_solution_dist:
-                best_solution = cur_solution
-                best_solution_dist = cur_dist
-            if iteration_dict and iteration_dict[iter]:
-                iteration_dict[iter] += [best_solution_dist]
+        """
+        Finds the neighbor with the shortest route
+        :param iteration_dict: if given, the best length after try i is added to iteration_dict[i + 1]
+        """
+        seeds = [random.getrandbits(32) for _ in range(self.n_tries)]
+        init_args = (self.list_of_passengers, self.taxi_start_position, self.initial_solution, self.distances,
+                     self.lazy_moves, self.or_opt)
+        if self.processes == 1:
+            _init_restart_worker(*init_args)
+            pool = None
+        else:
+            pool = multiprocessing.Pool(self.processes, _init_restart_worker, init_args)
+
+        start_time = time.perf_counter()
+        best_solution, best_solution_dist = None, utils.MAX_INT
+        self.best_distances = []
+        try:
+            for iter, (cur_solution, cur_dist) in enumerate(self._restart_results(seeds, pool)):
+                if self.observer is not None:
+                    self.observer.count('restarts')
+                    self.observer.best(cur_dist)
+                if cur_dist < best_solution_dist:
+                    best_solution = cur_solution
+                    best_solution_dist = cur_dist
+                self.best_distances.append(best_solution_dist)
+                if iteration_dict is not None:
+                    iteration_dict.setdefault(iter + 1, []).append(best_solution_dist)
+                if self.target_dist is not None and best_solution_dist <= self.target_dist:
+                    break
+                if self.time_limit is not None and time.perf_counter() - start_time >= self.time_limit:
+                    break
+                if self.budget is not None and self.budget.exhausted():
+                    break
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+        if best_solution is None:  # the budget was too small for a single restart
+            return self.initial_solution
         return best_solution
 
+    def _restart_results(self, seeds, pool):
+        """
+        yields the solution and the length of every restart, in the order of the seeds. A restart starts only when a
+        worker is free for it. With a limit on the evaluations it gets a share of the evaluations that the running
+        restarts do not hold: the free evaluations split evenly among the free workers, one of them kept for scoring
+        its solution. The evaluations the workers used are added to the distance matrix of this process, so the budget
+        counts them, and a restart that used more than its share raises RuntimeError, so the restarts never use more
+        than max_evaluations together
+        :param pool: a multiprocessing.Pool with _init_restart_worker, or None to run the restarts in this process
+        """
+        budget = self.budget
+        num_of_workers = 1 if pool is None else self.processes or multiprocessing.cpu_count()
+        seeds, pending = iter(seeds), collections.deque()  # (the result of a restart, its share of the evaluations)
+        while True:
+            while len(pending) < num_of_workers and not (budget is not None and budget.exhausted()):
+                share = None
+                if budget is not None and budget.remaining_evaluations() is not None:
+                    free = budget.remaining_evaluations() - sum(held for _, held in pending)
+                    share = free // (num_of_workers - len(pending))
+                    if share < MIN_RESTART_EVALUATIONS:
+                        break
+                seed = next(seeds, None)
+                if seed is None:
+                    break
+                task = seed, budget.for_task(share - 1 if share is not None else None) if budget is not None else None
+                if pool is None:  # its evaluations are counted by the shared distance matrix
+                    pending.append((_run_restart(task), share))
+                else:
+                    pending.append((pool.apply_async(_run_restart, (task,)), share))
+            if not pending:
+                return
+            result, share = pending.popleft()
+            solution, length, evaluations = result if pool is None else result.get()
+            if pool is not None:
+                self.distances.num_of_evaluations += evaluations
+            if share is not None and evaluations > share:
+                raise RuntimeError('a restart used ' + str(evaluations) + ' evaluations of its share of ' + str(share))
+            yield solution, length
+
 
 class RandomTaxiProblemSolver(TaxiProblemSolver):
     """
@@ -193,6 +596,7 @@ class RandomTaxiProblemSolver(TaxiProblemSolver):
     def __str__(self):
         return 'Random'
 
+    @observed
     def solve(self):
         all_passengers = [[passenger, False] for passenger in self.list_of_passengers]
         cur_position = self.taxi_start_position
@@ -213,38 +617,64 @@ class RandomTaxiProblemSolver(TaxiProblemSolver):
 
 class GreedyTaxiProblemSolver:
     """
-    Creates a solution by moving to the closest legal next station
+    Creates a solution by moving to the closest legal next station. The legal next stations (the pick up stations of
+    the waiting passengers and the drop stations of the passengers on the vehicle) are kept in a spatial grid index, so
+    every step only looks at the stations around the current one. The grid only finds the nearest station by the
+    Euclidean distance, so with another distance provider every step scans the row of the current station in the
+    matrix instead.
     """
+    observer = None  # a SolverObserver that collects counters while solving
 
-    def __init__(self, list_of_passengers, taxi_start_position):
+    def __init__(self, list_of_passengers, taxi_start_position, distances=None):
         self.list_of_passengers = list_of_passengers
         self.taxi_start_position = taxi_start_position
+        self.distances = distances if distances is not None else DistanceMatrix(list_of_passengers,
+                                                                                taxi_start_position)
 
     def __str__(self):
         return 'Greedy'
 
+    @observed
     def solve(self):
-        set_of_passengers = {passenger: False for passenger in self.list_of_passengers}
+        if self.distances.provider.euclidean:
+            solution = self._solve_with_grid()
+        else:
+            solution = self._solve_with_matrix()
+        if self.observer is not None:
+            self.observer.count('nearest_queries', len(solution) - 1)
+        return self.distances.ids_to_solution(solution)
+
+    def _solve_with_grid(self):
+        """:return: the station ids of the greedy solution, found with the grid index"""
+        coordinates = self.distances.coordinates.tolist()
+        next_stations = GridIndex(coordinates, len(self.list_of_passengers))
+        for station_id in range(1, len(coordinates), 2):
+            next_stations.insert(station_id)
+
+        cur_station = START_STATION
+        solution = [cur_station]
+        while len(next_stations):
+            cur_station = next_stations.nearest(*coordinates[cur_station])
+            next_stations.remove(cur_station)
+            if cur_station % 2 == 1:  # picked up the passenger
+                next_stations.insert(cur_station + 1)
+            solution.append(cur_station)
+        return solution
 
-        cur_position = self.taxi_start_position
-        solution = [(cur_position, 0)]
-        while set_of_passengers:
-            closest_passenger, optimal_dist = None, 2000
-            for passenger in set_of_passengers.keys():
-                passenger_position = passenger.start if not set_of_passengers[passenger] else passenger.end
-                cur_dist = utils.euclidean_distance(cur_position, passenger_position)
-                if cur_dist < optimal_dist:
-                    closest_passenger = passenger
-                    optimal_dist = cur_dist
-
-            if set_of_passengers[closest_passenger]:
-                cur_position = closest_passenger.end
-                solution.append((closest_passenger.end, closest_passenger.passenger_id, True))
-                del set_of_passengers[closest_passenger]
-            else:
-                cur_position = closest_passenger.start
-                solution.append((closest_passenger.start, closest_passenger.passenger_id, False))
-                set_of_passengers[closest_passenger] = True
+    def _solve_with_matrix(self):
+        """:return: the station ids of the greedy solution, found by scanning the rows of the distance matrix"""
+        matrix = self.distances.matrix
+        is_next = np.zeros(len(matrix), dtype=bool)
+        is_next[1::2] = True  # the pick up stations
+        cur_station = START_STATION
+        solution = [cur_station]
+        for _ in range(len(matrix) - 1):
+            next_stations = np.flatnonzero(is_next)
+            cur_station = int(next_stations[matrix[cur_station, next_stations].argmin()])
+            is_next[cur_station] = False
+            if cur_station % 2 == 1:  # picked up the passenger
+                is_next[cur_station + 1] = True
+            solution.append(cur_station)
         return solution
 
 
@@ -252,38 +682,117 @@ class BruteForceSolver:
     """
     Find the optimal solution by running over all the possible solutions
     """
-    def __init__(self, list_of_passengers, taxi_start_position):
+    observer = None  # a SolverObserver that collects counters while solving
+    budget = None  # a SolverBudget that limits the work of solve
+
+    def __init__(self, list_of_passengers, taxi_start_position, distances=None):
         self.list_of_passengers = list_of_passengers
         self.taxi_start_position = taxi_start_position
+        self.distances = distances if distances is not None else DistanceMatrix(list_of_passengers,
+                                                                                taxi_start_position)
 
     def __str__(self):
         return 'brute force'
 
+    @observed
     def solve(self):
         all_points = [(passenger.start, passenger.passenger_id, False) for passenger in self.list_of_passengers]\
                      + [(passenger.end, passenger.passenger_id, True) for passenger in self.list_of_passengers]
         possible_paths = [[(passenger.start, passenger.passenger_id, False),
                            (passenger.end, passenger.passenger_id, True)]
                           for passenger in self.list_of_passengers]
-        permutations = self.permutation(all_points, possible_paths)
-        return min(permutations, key=lambda p: utils.get_solution_len(p))
+        best_solution, best_dist = None, utils.MAX_INT
+        for solution in self.permutation(all_points, possible_paths):
+            if best_solution is not None and self.budget is not None and self.budget.exhausted():
+                break
+            dist = utils.get_solution_len(solution, self.distances)
+            if dist < best_dist:
+                best_solution, best_dist = solution, dist
+        return best_solution
 
     def permutation(self, points, constraints):
-        all_permutations = itertools.permutations(points, len(points))
-        permutations = [list(p) for p in all_permutations if
-                        all(p.index(constraints[i][0]) < p.index(constraints[i][1])
-                            for i in range(len(constraints)))]
-        for p in permutations:
-            p.insert(0, (self.taxi_start_position, 0))
-        return permutations
+        """yields the legal solutions, every permutation of the points that keeps the constraints"""
+        for p in itertools.permutations(points, len(points)):
+            if all(p.index(constraints[i][0]) < p.index(constraints[i][1]) for i in range(len(constraints))):
+                yield [(self.taxi_start_position, 0)] + list(p)
+
+
+class DynamicProgrammingSolver:
+    """
+    Finds the optimal solution with dynamic programming over the states of the passengers (waiting, on the vehicle or
+    dropped) and the current station. A state is a number in base 3 with a digit for every passenger, so a passenger
+    can not be dropped before it is picked up and every move goes to a state with a bigger number.
+    """
+    MAX_PASSENGERS = 13  # the tables hold 3^n * (2n + 1) entries
+    observer = None  # a SolverObserver that collects counters while solving
+    budget = None  # a SolverBudget that limits the work of solve
+
+    def __init__(self, list_of_passengers, taxi_start_position, distances=None):
+        self.list_of_passengers = list_of_passengers
+        self.taxi_start_position = taxi_start_position
+        self.distances = distances if distances is not None else DistanceMatrix(list_of_passengers,
+                                                                                taxi_start_position)
+
+    def __str__(self):
+        return 'dynamic programming'
+
+    @observed
+    def solve(self):
+        n = len(self.list_of_passengers)
+        if n > self.MAX_PASSENGERS:
+            raise ValueError('too many passengers for dynamic programming: ' + str(n))
+        num_of_states, num_of_stations = 3 ** n, 2 * n + 1
+        powers = 3 ** np.arange(n)
+        digits = (np.arange(num_of_states)[:, np.newaxis] // powers) % 3  # 0 waiting, 1 on the vehicle, 2 dropped
+        layers = digits.sum(axis=1)  # number of stations visited in every state
+
+        # cost[s, v]: length of the shortest route that reaches state s and ends at station v
+        cost = np.full((num_of_states, num_of_stations), utils.MAX_INT)
+        parent = np.zeros((num_of_states, num_of_stations), dtype=np.int16)
+        cost[0, START_STATION] = 0
+        with observe_phase(self.observer, 'tables'):
+            for layer in range(2 * n):
+                states = np.flatnonzero(layers == layer)
+                for k in range(n):
+                    if self.budget is not None and self.budget.exhausted():
+                        # no route is complete before the last layer, so the best solution so far is the greedy one
+                        return GreedyTaxiProblemSolver(self.list_of_passengers, self.taxi_start_position,
+                                                       self.distances).solve()
+                    for status, station in ((0, 2 * k + 1), (1, 2 * k + 2)):  # pick up or drop passenger k
+                        from_states = states[digits[states, k] == status]
+                        if not len(from_states):
+                            continue
+                        self.distances.num_of_evaluations += len(from_states)
+                        candidates = cost[from_states] + self.distances.matrix[:, station]
+                        best = candidates.argmin(axis=1)
+                        to_states = from_states + powers[k]
+                        cost[to_states, station] = candidates[np.arange(len(from_states)), best]
+                        parent[to_states, station] = best
+
+        state, station = num_of_states - 1, int(cost[-1].argmin())
+        if self.observer is not None:
+            self.observer.count('states', num_of_states)
+            self.observer.best(float(cost[-1, station]))
+        route = [station]
+        while state:
+            state, station = state - powers[(station - 1) // 2], int(parent[state, station])
+            route.append(station)
+        return self.distances.ids_to_solution(route[::-1])
 
 
 class BruteForcePruningSolver:
     """
-    Finds the optimal solution in  a more efficient way. This algorithm builds the solutions recursively and stops build
-    a solution if it is illegal or if it is longer than a given solution.
+    Finds the optimal solution with branch and bound. The solutions are built recursively in place, nearest station
+    first, and a partial solution is dropped if its length plus a lower bound on the rest of the route is not shorter
+    than the best solution so far. Two lower bounds are used, from the current station:
+    * passenger bound - the longest way to finish a single passenger (through its pick up station if it is waiting)
+    * incoming bound - every station that is left must be entered by its shortest possible incoming edge
     """
-    def __init__(self, list_of_passengers, taxi_start_position, best_dist=utils.MAX_INT, best_solution=None):
+    observer = None  # a SolverObserver that collects counters while solving
+    budget = None  # a SolverBudget that limits the work of solve
+
+    def __init__(self, list_of_passengers, taxi_start_position, best_dist=utils.MAX_INT, best_solution=None,
+                 distances=None):
         """
 
         :param list_of_passengers: list of passengers to try find a good rout between
@@ -291,35 +800,99 @@ class BruteForcePruningSolver:
         :param best_dist: the best distance so far for a solution. If the length of a partial solution is bigger than
         this number then the algorithm stops building it.
         :param best_solution: keep track of the best solution so far
+        :param distances: DistanceMatrix of the instance, built from the passengers if not given
         """
         self.list_of_passengers = list_of_passengers
         self.taxi_start_position = taxi_start_position
         self.best_dist = best_dist
         self.best_solution = best_solution
+        self.distances = distances if distances is not None else DistanceMatrix(list_of_passengers,
+                                                                                taxi_start_position)
+        self.stats = {}
+
+        num_of_stations = len(self.distances)
+        station_ids = np.arange(num_of_stations)
+        self._is_pick_up = station_ids % 2 == 1
+        self._partner = np.where(self._is_pick_up, station_ids + 1, station_ids - 1)
+        self._partner[START_STATION] = START_STATION
+        # shortest ways into a station: never from itself and never from the drop station into its pick up station
+        self._incoming = self.distances.matrix.copy()
+        np.fill_diagonal(self._incoming, utils.MAX_INT)
+        drops = station_ids[2::2]
+        self._incoming[drops, drops - 1] = utils.MAX_INT
+        self._route = []
 
     def __str__(self):
         return 'brute force with pruning'
 
+    @observed
     def solve(self, solution):
-        options = self.get_options(solution, self.list_of_passengers)
+        """
+        finds the best completion of the given partial solution. The result is in best_solution and best_dist, and the
+        number of nodes, the number of branches each bound pruned and the run time are in stats. Every node counts as
+        an evaluation of the budget
+        :param solution: a partial solution to start from, usually only the start station
+        """
+        self.stats = {'nodes': 0, 'pruned_by_length': 0, 'pruned_by_passenger_bound': 0,
+                      'pruned_by_incoming_bound': 0, 'time': 0}
+        start_time = time.perf_counter()
+
+        self._route = self.distances.solution_to_ids(solution)
+        remaining = np.ones(len(self.distances), dtype=bool)
+        remaining[self._route] = False
+        best_route = self._branch(self.distances.get_ids_len(self._route), remaining)
+        if best_route is not None:
+            self.best_solution = self.distances.ids_to_solution(best_route)
+
+        self.stats['time'] = time.perf_counter() - start_time
+        if self.observer is not None:
+            for name, value in self.stats.items():
+                if name != 'time':
+                    self.observer.count(name, value)
+
+    def _branch(self, cost, remaining):
+        """
+        :return: the best route that completes self._route if it is shorter than best_dist, else None
+        """
+        self.stats['nodes'] += 1
+        self.distances.num_of_evaluations += 1
+        station = self._route[-1]
+        options = np.flatnonzero(remaining & (self._is_pick_up | ~remaining[self._partner]))
         if len(options) == 0:
-            candidate = utils.get_solution_len(solution)
-            if candidate < self.best_dist:
-                self.best_dist = candidate
-                self.best_solution = solution
-            return
-        if utils.get_solution_len(solution) >= self.best_dist:
-            return
-        for opt in options:
-            self.solve(solution + [opt])
-
-    def get_options(self, solution, passengers):
-        options = []
-        for i, p in enumerate(passengers, 1):
-            optpick = (p.start, i, False)
-            optdrop = (p.end, i, True)
-            if optpick not in solution:
-                options.append(optpick)
-            elif optdrop not in solution:
-                options.append(optdrop)
-        return options
\ No newline at end of file
+            if cost < self.best_dist:
+                self.best_dist = cost
+                if self.observer is not None:
+                    self.observer.best(cost)
+                return list(self._route)
+            return None
+        if cost >= self.best_dist:
+            self.stats['pruned_by_length'] += 1
+            return None
+
+        matrix = self.distances.matrix
+        left = np.flatnonzero(remaining)
+        drops = left[~self._is_pick_up[left]]
+        pick_ups = drops - 1
+        passenger_bound = np.where(remaining[pick_ups], matrix[station, pick_ups] + matrix[pick_ups, drops],
+                                   matrix[station, drops]).max()
+        if cost + passenger_bound >= self.best_dist:
+            self.stats['pruned_by_passenger_bound'] += 1
+            return None
+        incoming_bound = self._incoming[np.append(left, station)][:, left].min(axis=0).sum()
+        if cost + incoming_bound >= self.best_dist:
+            self.stats['pruned_by_incoming_bound'] += 1
+            return None
+
+        best_route = None
+        for next_station in options[np.argsort(matrix[station, options], kind='stable')]:
+            remaining[next_station] = False
+            self._route.append(int(next_station))
+            route = self._branch(cost + matrix[station, next_station], remaining)
+            if route is not None:
+                best_route = route
+            self._route.pop()
+            remaining[next_station] = True
+            # out of budget, only the nearest branch is finished, so a route is found even without a best solution
+            if self.budget is not None and self.budget.exhausted():
+                break
+        return best_route
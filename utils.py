@@ -1,7 +1,13 @@
+import contextlib
 import math
-import matplotlib.pyplot as plt
+import random
+from route import Route
 
 MAX_INT = float('inf')
+EPSILON = 0.000000001  # smallest change in length that counts as an improvement
+MIN_SEGMENT_LENGTH = 2  # shorter segments are single stations, see get_legal_moves
+MAX_SEGMENT_LENGTH = 3
+SEGMENT_SAMPLE_ATTEMPTS = 10  # times the length of the route, before sample_legal_segment_move gives up
 
 
 def euclidean_distance(a, b):
@@ -30,12 +36,29 @@ def check_solution(solution):
             passengers_off.add(passengers_id)
 
 
-def get_solution_len(solution):
+@contextlib.contextmanager
+def seeded_random(seed):
+    """
+    seeds the random module for the body of the with statement, and restores its former state after it, so a task that
+    runs in the process of the caller (instead of a worker process) does not change the random numbers of the caller
+    """
+    state = random.getstate()
+    random.seed(seed)
+    try:
+        yield
+    finally:
+        random.setstate(state)
+
+
+def get_solution_len(solution, distances=None):
     """
     checks the length of the given solution
     :param solution: solution to check its length
+    :param distances: DistanceMatrix of the instance. If given, the distances are looked up instead of computed
     :return: the length
     """
+    if distances is not None:
+        return distances.get_solution_len(solution)
 
     s = 0
     for i in range(1, len(solution)):
@@ -55,24 +78,6 @@ def set_data_for_solution(solution):
     return x, y, z, s
 
 
-def plot_multiple_solutions(num_rows, num_cols, solutions, algs):
-    """plot solutions of several algorithms in num_rows*num_cols subplots"""
-
-    fig, axs = plt.subplots(num_rows, num_cols, figsize=(15, 6), facecolor='w', edgecolor='k')
-    fig.subplots_adjust(hspace=.5, wspace=.001)
-
-    for i in range(num_rows):
-        for j in range(num_cols):
-            x, y, z, s = set_data_for_solution(solutions[num_cols * i + j])
-            axs[i, j].plot(x, y)
-
-            axs[i, j].set_title(str(algs[num_cols * i + j]) + ": " + str(s))
-            for k in range(len(x)):
-                axs[i, j].annotate(str(z[k]), (x[k], y[k]),
-                                   textcoords="offset points", xytext=(0, 5), ha='center')
-    plt.show()
-
-
 def get_other_station_from_solution(solution, passenger_id):
     """
 
@@ -114,3 +119,295 @@ def get_set_of_neighbors(solution):
                 set_of_neighbors.append(new_nieghbor)
 
     return set_of_neighbors
+
+
+def get_partner_station(station_id):
+    """the id of the other station of the same passenger (pick up stations are odd, drop stations are even)"""
+    return station_id + 1 if station_id % 2 else station_id - 1
+
+
+def get_station_moves(route, station_index, nearest=None):
+    """
+    :param route: a given solution as a Route or a list of station ids
+    :param station_index: the index of the station to move
+    :param nearest: the ids of the nearest stations of every station (see DistanceMatrix.nearest_stations). If given,
+    the station only moves right before or right after one of its nearest stations
+    :return: a list of the legal moves of the station
+    """
+    partner_index = route.index(get_partner_station(route[station_index]))
+    if route[station_index] % 2 == 0:  # it is a destination station
+        first, last = partner_index + 1, len(route) - 1
+    else:  # it is an origin station
+        first, last = 1, partner_index - 1
+    if nearest is None:
+        return [(station_index, target_index) for target_index in range(first, last + 1)
+                if target_index != station_index]
+
+    moves, seen = [], {station_index}
+    for neighbor in nearest[route[station_index]]:
+        neighbor_index = route.index(neighbor)
+        if neighbor_index > station_index:
+            neighbor_index -= 1  # its index in the route without the moved station
+        for target_index in (neighbor_index, neighbor_index + 1):  # right before and right after the neighbor
+            if first <= target_index <= last and target_index not in seen:
+                seen.add(target_index)
+                moves.append((station_index, target_index))
+    return moves
+
+
+def get_legal_moves(route, nearest=None):
+    """
+    A move (station_index, target_index) takes the station at station_index out of the route and puts it back at
+    target_index of the route without it. A move is legal if the passenger is still picked up before it is dropped.
+    :param route: a given solution as a Route or a list of station ids
+    :param nearest: if given, only the moves that put a station next to one of its nearest stations, see
+    get_station_moves. Then there are O(n * k) moves instead of O(n^2)
+    :return: a list of all legal moves for this route, in the same order as get_set_of_neighbors
+    """
+    moves = []
+    for station_index in range(1, len(route)):
+        moves += get_station_moves(route, station_index, nearest)
+    return moves
+
+
+def is_legal_move(route, move):
+    """checks if the move (station_index, target_index) keeps every pick up before its drop"""
+    station_index, target_index = move
+    if station_index == target_index:
+        return False
+    partner_index = route.index(get_partner_station(route[station_index]))
+    if route[station_index] % 2 == 0:  # it is a destination station
+        return target_index > partner_index
+    return target_index < partner_index
+
+
+def sample_legal_move(route):
+    """
+    draws a uniformly random legal move without listing all the moves: a station and a target are drawn uniformly and
+    redrawn while the move is illegal. Every passenger has at least len(route) - 3 legal moves, so about half of the
+    draws are legal.
+    :param route: a given solution as a Route or a list of station ids
+    :return: a random legal move (station_index, target_index), or None if the route has no legal moves
+    """
+    if len(route) <= 3:  # at most one passenger
+        return None
+    while True:
+        move = random.randint(1, len(route) - 1), random.randint(1, len(route) - 1)
+        if is_legal_move(route, move):
+            return move
+
+
+def _segment_targets(route, start_index, length):
+    """
+    the legal targets of the segment of 'length' stations from start_index follow from the positions of the partners
+    of its stations, in O(length): a drop must stay after its pick up and a pick up before its drop
+    :return: the first and the last legal target_index, and True if the segment holds both stations of a passenger
+    (so it can't be reversed)
+    """
+    end_index = start_index + length
+    first, last, has_passenger = 1, len(route) - length, False
+    for station_index in range(start_index, end_index):
+        partner_index = route.index(get_partner_station(route[station_index]))
+        if start_index <= partner_index < end_index:
+            has_passenger = True
+        elif route[station_index] % 2 == 0:  # a drop, its pick up is before the segment
+            first = max(first, partner_index + 1)
+        else:  # a pick up, its drop is after the segment
+            last = min(last, partner_index - length)
+    return first, last, has_passenger
+
+
+def get_legal_segment_moves(route, max_length=MAX_SEGMENT_LENGTH):
+    """
+    A segment move (start_index, length, target_index, reverse) takes the 'length' stations from start_index out of
+    the route, reverses them if reverse is set and puts them back at target_index of the route without them (or-opt).
+    :param route: a given solution as a Route or a list of station ids
+    :param max_length: the longest segment to move, segments have at least MIN_SEGMENT_LENGTH stations
+    :return: a list of all the legal segment moves of the route
+    """
+    moves = []
+    for length in range(MIN_SEGMENT_LENGTH, max_length + 1):
+        for start_index in range(1, len(route) - length + 1):
+            first, last, has_passenger = _segment_targets(route, start_index, length)
+            for reverse in ((False,) if has_passenger else (False, True)):
+                moves += [(start_index, length, target_index, reverse) for target_index in range(first, last + 1)
+                          if reverse or target_index != start_index]
+    return moves
+
+
+def _is_legal_segment_move(route, move):
+    """checks if the segment move (start_index, length, target_index, reverse) keeps every pick up before its drop"""
+    start_index, length, target_index, reverse = move
+    if target_index == start_index and not reverse:
+        return False
+    first, last, has_passenger = _segment_targets(route, start_index, length)
+    return first <= target_index <= last and not (reverse and has_passenger)
+
+
+def sample_legal_segment_move(route, max_length=MAX_SEGMENT_LENGTH):
+    """
+    draws a random legal segment move by redrawing illegal ones, like sample_legal_move
+    :return: a random legal segment move (start_index, length, target_index, reverse), or None if none was found
+    """
+    for _ in range(SEGMENT_SAMPLE_ATTEMPTS * len(route)):
+        length = random.randint(MIN_SEGMENT_LENGTH, max_length)
+        if len(route) - length < 2:
+            return None
+        move = (random.randint(1, len(route) - length), length, random.randint(1, len(route) - length),
+                random.random() < 0.5)
+        if _is_legal_segment_move(route, move):
+            return move
+    return None
+
+
+def iter_shuffled_legal_moves(route):
+    """
+    yields all the legal moves of the route in a uniformly random order. The pairs (station_index, target_index) are
+    shuffled lazily (Fisher-Yates with a dictionary of the swapped entries), so the memory grows with the number of
+    pairs drawn so far, the illegal pairs that are skipped included, instead of holding all the moves at once.
+    :param route: a given solution as a Route or a list of station ids
+    """
+    num_of_targets = len(route) - 1
+    num_of_pairs = num_of_targets * num_of_targets
+    swapped = {}
+    for k in range(num_of_pairs):
+        r = random.randint(k, num_of_pairs - 1)
+        pair = swapped.get(r, r)
+        if r != k:
+            swapped[r] = swapped.pop(k, k)
+        else:
+            swapped.pop(k, None)
+        move = 1 + pair // num_of_targets, 1 + pair % num_of_targets
+        if is_legal_move(route, move):
+            yield move
+
+
+def get_random_neighbor(solution):
+    """
+    :param solution: a given solution
+    :return: a uniformly random neighbor of the solution, without building the set of all the neighbors
+    """
+    route = [0] + [2 * station[1] - 1 + int(station[2]) for station in solution[1:]]
+    move = sample_legal_move(route)
+    neighbor = list(solution)
+    if move is not None:
+        apply_move(neighbor, move)
+    return neighbor
+
+
+def get_move_delta(route, move, distances):
+    """
+    calculates the change in the length of the route if the move is applied, in constant time
+    :param route: a given solution as a Route or a list of station ids
+    :param move: a legal move (station_index, target_index) or segment move (start_index, length, target_index,
+    reverse)
+    :param distances: DistanceMatrix of the instance
+    :return: the length of the route after the move minus the length before it
+    """
+    if len(move) == 4:
+        return get_segment_move_delta(route, move, distances)
+    station_index, target_index = move
+    distances.num_of_evaluations += 1
+    d = distances.distance
+    station = route[station_index]
+
+    prev_station = route[station_index - 1]
+    delta = -d(prev_station, station)
+    if station_index + 1 < len(route):
+        next_station = route[station_index + 1]
+        delta += d(prev_station, next_station) - d(station, next_station)
+
+    # the stations around the target in the route without the moved station
+    left = route[target_index - 1] if target_index - 1 < station_index else route[target_index]
+    delta += d(left, station)
+    if target_index < len(route) - 1:
+        right = route[target_index] if target_index < station_index else route[target_index + 1]
+        delta += d(station, right) - d(left, right)
+    return delta
+
+
+def get_segment_move_delta(route, move, distances):
+    """
+    calculates the change in the length of the route if the segment move is applied, in constant time from the edges
+    around the old and the new place of the segment (the distances are symmetric, so a reversed segment keeps the
+    length of its inner edges)
+    :param route: a given solution as a Route or a list of station ids
+    :param move: a legal segment move (start_index, length, target_index, reverse)
+    :param distances: DistanceMatrix of the instance
+    :return: the length of the route after the move minus the length before it
+    """
+    start_index, length, target_index, reverse = move
+    distances.num_of_evaluations += 1
+    d = distances.distance
+    end_index = start_index + length
+    head, tail = route[start_index], route[end_index - 1]
+
+    prev_station = route[start_index - 1]
+    delta = -d(prev_station, head)
+    if end_index < len(route):
+        next_station = route[end_index]
+        delta += d(prev_station, next_station) - d(tail, next_station)
+
+    if reverse:
+        head, tail = tail, head
+    # the stations around the target in the route without the segment
+    left = route[target_index - 1] if target_index - 1 < start_index else route[target_index - 1 + length]
+    delta += d(left, head)
+    if target_index < len(route) - length:
+        right = route[target_index] if target_index < start_index else route[target_index + length]
+        delta += d(tail, right) - d(left, right)
+    return delta
+
+
+def get_move_edges(route, move):
+    """
+    :param route: a given solution as a Route or a list of station ids
+    :param move: a legal move (station_index, target_index) or segment move (start_index, length, target_index,
+    reverse)
+    :return: the edges (from station id, to station id) the move removes from the route and the edges it adds to it.
+    The edges inside a reversed segment are only turned around, so they are not in either list
+    """
+    if len(move) == 4:
+        start_index, length, target_index, reverse = move
+    else:
+        (start_index, target_index), length, reverse = move, 1, False
+    end_index = start_index + length
+    head, tail = route[start_index], route[end_index - 1]
+    removed, added = [(route[start_index - 1], head)], []
+    if end_index < len(route):
+        removed.append((tail, route[end_index]))
+        added.append((route[start_index - 1], route[end_index]))
+
+    if reverse:
+        head, tail = tail, head
+    left = route[target_index - 1] if target_index - 1 < start_index else route[target_index - 1 + length]
+    added.append((left, head))
+    if target_index < len(route) - length:
+        right = route[target_index] if target_index < start_index else route[target_index + length]
+        added.append((tail, right))
+        removed.append((left, right))
+        if target_index == start_index:  # a segment reversed in place keeps the edge that closes its gap
+            removed.remove((left, right))
+            added.remove((left, right))
+    return removed, added
+
+
+def apply_move(route, move):
+    """
+    applies the move (station_index, target_index) or the segment move (start_index, length, target_index, reverse) on
+    the route (a Route or a list) in place
+    """
+    if len(move) == 4:
+        start_index, length, target_index, reverse = move
+        if isinstance(route, Route):
+            route.move_segment(start_index, length, target_index, reverse)
+        else:
+            segment = route[start_index:start_index + length]
+            del route[start_index:start_index + length]
+            route[target_index:target_index] = segment[::-1] if reverse else segment
+        return
+    station_index, target_index = move
+    if isinstance(route, Route):
+        route.move(station_index, target_index)
+    else:
+        route.insert(target_index, route.pop(station_index))